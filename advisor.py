@@ -0,0 +1,194 @@
+"""
+Project Name: blackjack-bot
+File Name: advisor.py
+
+Description: Answers the '$hint' command: the expected value of hitting and of holding for a player's hand, given the
+    dealer's visible card and the cards left in the shoe.
+"""
+
+
+from collections import OrderedDict
+import odds
+
+# the states of a hand that a player can decide on: (total of the cards that are not an Ace, whether there is an Ace)
+HAND_STATES = tuple((hand_value, has_ace) for has_ace in (False, True) for hand_value in range(0, 22)
+                    if (hand_value + 1 if has_ace else hand_value) <= 21)
+
+
+def _dealer_table(chances):
+    """
+    Probability of every final result of the dealer's hand for every upcard, when every card is drawn with the
+    passed chances.
+    :param chances: tuple of the chance to draw every value from 1 (Ace) to 10
+    :return: dict of upcard value to a list of the probability of every result in odds.OUTCOMES
+    """
+    finals = dict()
+
+    def final(hand_value, has_ace):
+        key = (hand_value, has_ace)
+        if key in finals:
+            return finals[key]
+        low_value = hand_value + 1 if has_ace else hand_value
+        result = [0.0] * len(odds.OUTCOMES)
+        if low_value >= 17:
+            result[odds.BUST if low_value > 21 else low_value - 17] = 1.0
+        else:
+            for i, chance in enumerate(chances):
+                if i == 0 and has_ace: # another Ace leaves the hand as it is, so it is drawn past
+                    continue
+                if chance:
+                    after = final(hand_value, True) if i == 0 else final(hand_value + i + 1, has_ace)
+                    for j, p in enumerate(after):
+                        result[j] += chance * p
+            if has_ace and chances[0] < 1:
+                result = [p / (1 - chances[0]) for p in result]
+        finals[key] = result
+        return result
+
+    return {value: final(0, True) if value == 1 else final(value, False) for value in range(1, 11)}
+
+
+def _stand_ev(best_value, dealer):
+    """
+    Expected value of holding, in bets, under the payout rules of engine.settle_game.
+    :param best_value: int best value of the player's hand
+    :param dealer: list of the probability of every final result of the dealer's hand
+    :return: float expected value
+    """
+    dealer_21 = dealer[odds.OUTCOMES.index(21)]
+    if best_value == 21: # pushes against a dealer with 21, wins one and a half times the bet otherwise
+        return 1.5 * (1 - dealer_21)
+    ev = dealer[odds.BUST] - dealer_21
+    for i, dealer_value in enumerate(odds.OUTCOMES[:4]):
+        if best_value > dealer_value:
+            ev += dealer[i]
+        elif best_value < dealer_value:
+            ev -= dealer[i]
+    return ev
+
+
+def _solve(chances, dealer):
+    """
+    Expected value of holding and of hitting for every hand state against one dealer upcard. After a hit, the player
+    may hit again in the next round, so hitting is worth the best of both choices of the next hand.
+    :param chances: tuple of the chance to draw every value from 1 (Ace) to 10
+    :param dealer: list of the probability of every final result of the dealer's hand
+    :return: dict of hand state to a tuple of the expected value of holding and of hitting
+    """
+    table = dict()
+
+    def best(hand_value, has_ace):
+        if (hand_value + 1 if has_ace else hand_value) > 21:
+            return -1.0
+        return max(solve(hand_value, has_ace))
+
+    def solve(hand_value, has_ace):
+        key = (hand_value, has_ace)
+        if key in table:
+            return table[key]
+        low_value = hand_value + 1 if has_ace else hand_value
+        best_value = low_value + 10 if has_ace and low_value <= 11 else low_value
+        stand = _stand_ev(best_value, dealer)
+        hit = 0.0
+        for i, chance in enumerate(chances[1:], 2):
+            if chance:
+                hit += chance * best(hand_value + i, has_ace)
+        if not has_ace:
+            hit += chances[0] * best(hand_value, True)
+        else:
+            # another Ace leaves the hand as it is, so the player faces the same choice again
+            keep_hitting = hit / (1 - chances[0]) if chances[0] < 1 else stand
+            hit = keep_hitting if keep_hitting > stand else hit + chances[0] * stand
+        table[key] = (stand, hit)
+        return table[key]
+
+    for hand_value, has_ace in HAND_STATES:
+        solve(hand_value, has_ace)
+    return table
+
+
+class Advisor:
+    """
+    Tells a player whether hitting or holding has the higher expected value.
+
+    For every composition of the shoe, the expected values of every hand state against every dealer upcard are
+    solved at once and kept as a table, so the players of a table asking during the same round are answered with a
+    lookup. The tables of the most recent compositions are kept, the least recently used ones are dropped.
+
+    Within a decision every card is drawn with the chances of the cards left in the shoe, ignoring that the cards the
+    player and the dealer draw afterwards change those chances slightly. This keeps solving a composition to about a
+    millisecond, where the exact recursion of :mod: 'odds' can take a tenth of a second on a six deck shoe.
+
+    Parameters:
+        cache_size | int
+            The number of compositions whose tables are kept
+
+    Attributes:
+        tables | OrderedDict
+            The solved tables, from least to most recently used, keyed by composition and upcard value
+    """
+
+    def __init__(self, cache_size=64):
+        self.cache_size = cache_size
+        self.tables = OrderedDict()
+
+    def table(self, counts, upcard):
+        """
+        :param counts: composition of the cards the player cannot see
+        :param upcard: int value of the dealer's visible card
+        :return: dict of hand state to a tuple of the expected value of holding and of hitting
+        """
+        key = (counts, upcard)
+        table = self.tables.get(key)
+        if table is not None:
+            self.tables.move_to_end(key)
+            return table
+        if not sum(counts): # the shoe is shuffled when it runs out, which is assumed to bring back a full deck
+            counts = odds.FULL_DECK
+        total = sum(counts)
+        chances = tuple(count / total for count in counts)
+        table = _solve(chances, _dealer_table(chances)[upcard])
+        self.tables[key] = table
+        if len(self.tables) > self.cache_size:
+            self.tables.popitem(last=False)
+        return table
+
+    def evaluate(self, hand_value, has_ace, upcard, counts):
+        """
+        :param hand_value: int total of the cards in the hand that are not an Ace
+        :param has_ace: bool stating if there is an Ace in the hand
+        :param upcard: int value of the dealer's visible card
+        :param counts: composition of the cards the player cannot see
+        :return: tuple of the expected value of holding and of hitting, in bets
+        """
+        return self.table(tuple(counts), upcard)[(hand_value, has_ace)]
+
+    def advise(self, player, dealer, shoe):
+        """
+        Evaluates a player's hand against the dealer's visible card. The cards left in the shoe and the dealer's
+        hidden cards are the cards the player cannot see.
+        :param player: 'Player' asking for advice, who must not be busted
+        :param dealer: 'Dealer' of the table
+        :param shoe: 'Shoe' of the table
+        :return: tuple of the expected value of holding and of hitting, in bets
+        """
+        counts = _add(odds.shoe_composition(shoe), dealer.hand[1:])
+        return self.evaluate(player.hand_value, player.has_ace, dealer.hand[0].value, counts)
+
+    def warm(self, dealer, shoe):
+        """
+        Solves the table for the current composition of the shoe ahead of time, e.g. right after dealing.
+        :param dealer: 'Dealer' of the table
+        :param shoe: 'Shoe' of the table
+        """
+        self.table(_add(odds.shoe_composition(shoe), dealer.hand[1:]), dealer.hand[0].value)
+
+
+def _add(counts, cards):
+    """
+    :return: new composition with the cards added
+    """
+    counts = list(counts)
+    for c in cards:
+        counts[c.value - 1] += 1
+    return tuple(counts)
@@ -0,0 +1,329 @@
+"""
+Project Name: blackjack-bot
+File Name: batch.py
+
+Description: Simulates millions of hands at once with NumPy arrays to measure the house edge and the drift of the banks,
+    optionally sharded over a pool of processes.
+"""
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import card
+
+# value in Blackjack of every card, indexed by the code of the card
+DECK_VALUES = np.array([c.value for c in card.Card.DECK], dtype=np.int8)
+
+CHUNK_SIZE = 1 << 16
+
+# edges of the bins of a bank histogram; fixed so that histograms of different shards can be added together
+BANK_BINS = np.concatenate(([-np.inf], np.arange(0, 50001, 500), [np.inf]))
+
+WON = 1
+PUSH = 0
+LOST = -1
+
+
+class BatchResult:
+    """
+    Totals of a batch of simulated hands.
+
+    Attributes:
+        hands | int
+            Number of hands settled
+        wins | int
+            Number of hands won by the player
+        losses | int
+            Number of hands lost by the player
+        pushes | int
+            Number of hands that tied with the dealer
+        blackjacks | int
+            Number of hands won with a hand value of 21
+        net | int
+            Memes won by players minus memes lost by players
+        net_squared | int
+            Sum of the squared payout of every hand, used for the variance of the payouts
+        bank_histogram | numpy array of int
+            Number of players whose final bank fell in every bin of BANK_BINS
+    """
+
+    def __init__(self):
+        self.hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.pushes = 0
+        self.blackjacks = 0
+        self.net = 0
+        self.net_squared = 0
+        self.bank_histogram = np.zeros(len(BANK_BINS) - 1, dtype=np.int64)
+
+    def merge(self, other):
+        """
+        Adds the totals of another result to this one. All totals are integers, so merging is exact and the order
+        the results are merged in does not matter.
+        :param other: 'BatchResult' to add
+        :return: this 'BatchResult'
+        """
+        self.hands += other.hands
+        self.wins += other.wins
+        self.losses += other.losses
+        self.pushes += other.pushes
+        self.blackjacks += other.blackjacks
+        self.net += other.net
+        self.net_squared += other.net_squared
+        self.bank_histogram += other.bank_histogram
+        return self
+
+    def record_banks(self, banks):
+        """
+        Adds final banks of players to the bank histogram.
+        :param banks: int array of banks
+        """
+        self.bank_histogram += np.histogram(banks, BANK_BINS)[0]
+
+    def record(self, results, payouts, blackjacks):
+        """
+        Adds a batch of settled hands to the totals.
+        :param results: array of WON, PUSH or LOST for every hand
+        :param payouts: array of the memes won (positive) or lost (negative) on every hand
+        :param blackjacks: bool array of the hands won with a hand value of 21
+        """
+        self.hands += len(results)
+        self.wins += int(np.count_nonzero(results == WON))
+        self.losses += int(np.count_nonzero(results == LOST))
+        self.pushes += int(np.count_nonzero(results == PUSH))
+        self.blackjacks += int(np.count_nonzero(blackjacks))
+        payouts = payouts.astype(np.int64)
+        self.net += int(payouts.sum())
+        self.net_squared += int((payouts * payouts).sum())
+
+    def house_edge(self, bet_amount):
+        """
+        :param bet_amount: int amount bet on every hand
+        :return: float fraction of every bet kept by the house
+        """
+        if self.hands == 0:
+            return 0.0
+        return -self.net / (self.hands * bet_amount)
+
+    def standard_error(self, bet_amount):
+        """
+        :param bet_amount: int amount bet on every hand
+        :return: float standard error of house_edge
+        """
+        if self.hands < 2:
+            return 0.0
+        mean = self.net / self.hands
+        variance = (self.net_squared - self.hands * mean * mean) / (self.hands - 1)
+        return float(np.sqrt(variance / self.hands)) / bet_amount
+
+
+def _hand_values(hard, has_ace):
+    """
+    Vectorized :meth: 'Player.get_hand_values'. Like the Player, only a single Ace in a hand is counted.
+    :param hard: int array of the summed values of every card in a hand that is not an Ace
+    :param has_ace: bool array stating if a hand holds an Ace
+    :return: tuple of int arrays with the lowest value and the best value of 21 or below (if any) of every hand
+    """
+    low = hard + has_ace
+    high = low + 10 * has_ace
+    return low, np.where(high <= 21, high, low)
+
+
+def _has_blackjack(hard, has_ace):
+    """
+    Vectorized :meth: 'Player.has_blackjack'.
+    """
+    low = hard + has_ace
+    return (low == 21) | (has_ace & (low + 10 == 21))
+
+
+def _draw(rng, decks, position, rows):
+    """
+    Draws a random card from the undrawn part of every deck in rows. This is one step of a Fisher-Yates shuffle, so
+    only the cards that are actually drawn get shuffled.
+    :return: int array of the values of the drawn cards
+    """
+    start = position[rows]
+    picks = rng.integers(start, 52)
+    drawn = decks[rows, picks]
+    decks[rows, picks] = decks[rows, start]
+    position[rows] = start + 1
+    return drawn
+
+
+def _hit(rng, decks, position, hard, has_ace, mask):
+    """
+    Draws the next card off every deck in mask and adds it to the hands.
+    """
+    rows = np.flatnonzero(mask)
+    drawn = _draw(rng, decks, position, rows)
+    is_ace = drawn == 1
+    hard[rows] += np.where(is_ace, 0, drawn)
+    has_ace[rows] |= is_ace
+
+
+def play_hands(rng, hands, bet_amount=100, stand_on=17):
+    """
+    Plays a batch of independent hands, each one a player against the dealer with a new deck, using the rules of
+    :class: 'Engine'. The player keeps hitting until the best value of their hand reaches stand_on.
+    :param rng: numpy Generator used to shuffle the decks
+    :param hands: int number of hands to play
+    :param bet_amount: int amount bet on every hand
+    :param stand_on: int hand value at which the player holds
+    :return: tuple of arrays: the result (WON, PUSH or LOST), the payout and whether the hand won with blackjack
+    """
+    decks = np.tile(DECK_VALUES, (hands, 1))
+    position = np.zeros(hands, dtype=np.intp)
+    rows = np.arange(hands)
+
+    # the dealer is dealt first, then the player, just like BlackJackBot.deal_cards
+    dealer_hard = np.zeros(hands, dtype=np.int16)
+    dealer_ace = np.zeros(hands, dtype=bool)
+    player_hard = np.zeros(hands, dtype=np.int16)
+    player_ace = np.zeros(hands, dtype=bool)
+    for hard, has_ace in ((dealer_hard, dealer_ace), (dealer_hard, dealer_ace),
+                          (player_hard, player_ace), (player_hard, player_ace)):
+        drawn = _draw(rng, decks, position, rows)
+        is_ace = drawn == 1
+        hard += np.where(is_ace, 0, drawn)
+        has_ace |= is_ace
+
+    low, best = _hand_values(player_hard, player_ace)
+    hitting = (best < stand_on) & (low <= 21)
+    while hitting.any():
+        _hit(rng, decks, position, player_hard, player_ace, hitting)
+        low, best = _hand_values(player_hard, player_ace)
+        hitting &= (best < stand_on) & (low <= 21)
+    player_bust = low > 21
+
+    dealer_low, _ = _hand_values(dealer_hard, dealer_ace)
+    hitting = dealer_low < 17
+    while hitting.any():
+        _hit(rng, decks, position, dealer_hard, dealer_ace, hitting)
+        dealer_low, _ = _hand_values(dealer_hard, dealer_ace)
+        hitting &= dealer_low < 17
+
+    player_blackjack = _has_blackjack(player_hard, player_ace)
+    dealer_blackjack = _has_blackjack(dealer_hard, dealer_ace)
+    dealer_bust = dealer_low > 21
+
+    results = np.where(best > dealer_low, WON, np.where(best == dealer_low, PUSH, LOST)).astype(np.int8)
+    results[dealer_bust] = WON
+    results[player_bust] = LOST
+    results[dealer_blackjack] = np.where(player_blackjack[dealer_blackjack], PUSH, LOST)
+
+    won = results == WON
+    blackjacks = won & player_blackjack
+    # User.gain_bet pays one and a half times the bet on blackjack, User.lose_bet takes the bet
+    payouts = np.where(won, np.where(blackjacks, int(bet_amount * 1.5), bet_amount), 0)
+    payouts = payouts - np.where(results == LOST, bet_amount, 0)
+    return results, payouts.astype(np.int32), blackjacks
+
+
+def simulate(hands, bet_amount=100, stand_on=17, seed=None, chunk_size=CHUNK_SIZE):
+    """
+    Plays a large number of hands in chunks and totals the results.
+    :param hands: int number of hands to play
+    :param bet_amount: int amount bet on every hand
+    :param stand_on: int hand value at which the player holds
+    :param seed: seed or SeedSequence for the numpy Generator, None for a random seed
+    :param chunk_size: int number of hands played at once, bounds the memory used
+    :return: 'BatchResult' with the totals of every hand
+    """
+    rng = np.random.default_rng(seed)
+    result = BatchResult()
+    while result.hands < hands:
+        n = min(chunk_size, hands - result.hands)
+        result.record(*play_hands(rng, n, bet_amount, stand_on))
+    return result
+
+
+def simulate_banks(players, games, bet_amount=100, stand_on=17, seed=None, bank=5000):
+    """
+    Follows the bank of every player over a number of games, refilling banks that run low between games the same
+    way BlackJackBot.reset_players does.
+    :param players: int number of players
+    :param games: int number of games every player plays
+    :param bet_amount: int amount bet on every hand
+    :param stand_on: int hand value at which the player holds
+    :param seed: seed or SeedSequence for the numpy Generator, None for a random seed
+    :param bank: int starting bank of every player
+    :return: int64 array with the final bank of every player
+    """
+    rng = np.random.default_rng(seed)
+    banks = np.full(players, bank, dtype=np.int64)
+    for _ in range(games):
+        _, payouts, _ = play_hands(rng, players, bet_amount, stand_on)
+        banks += payouts
+        banks[banks <= 500] = 1000
+    return banks
+
+
+def _run_shard(seed, hands, bet_amount, stand_on, players, games):
+    """
+    Runs one shard of simulate_sharded in a worker process.
+    :return: 'BatchResult' of the shard
+    """
+    rng = np.random.default_rng(seed)
+    result = simulate(hands, bet_amount, stand_on, rng)
+    if players:
+        result.record_banks(simulate_banks(players, games, bet_amount, stand_on, rng))
+    return result
+
+
+def _split(total, parts):
+    """
+    :return: list of parts ints that add up to total and differ by at most one
+    """
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def simulate_sharded(hands, bet_amount=100, stand_on=17, seed=None, workers=None, players=0, games=0):
+    """
+    Splits a large simulation into one shard per worker process and merges the results. Every shard gets its own
+    stream of random numbers spawned from one SeedSequence, so a seed reproduces the same result for the same number
+    of workers.
+    :param hands: int number of hands to play in total
+    :param bet_amount: int amount bet on every hand
+    :param stand_on: int hand value at which the player holds
+    :param seed: seed for the root SeedSequence, None for a random seed
+    :param workers: int number of worker processes, None for one per core
+    :param players: int number of players whose banks are followed for the bank histogram, 0 to skip it
+    :param games: int number of games every one of those players plays
+    :return: 'BatchResult' with the merged totals of every shard
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    result = BatchResult()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = [executor.submit(_run_shard, shard_seed, shard_hands, bet_amount, stand_on, shard_players, games)
+                  for shard_seed, shard_hands, shard_players in zip(seeds, _split(hands, workers),
+                                                                     _split(players, workers))]
+        for shard in shards:
+            result.merge(shard.result())
+    return result
+
+
+def test():
+    import time
+    start = time.perf_counter()
+    result = simulate(10 ** 7, seed=0)
+    elapsed = time.perf_counter() - start
+    print("{} hands in {:.2f}s ({:.0f} hands/s)".format(result.hands, elapsed, result.hands / elapsed))
+    print("wins {} losses {} pushes {} blackjacks {}".format(result.wins, result.losses, result.pushes,
+                                                              result.blackjacks))
+    print("house edge {:.4f} +/- {:.4f}".format(result.house_edge(100), result.standard_error(100)))
+    banks = simulate_banks(10000, 100, seed=0)
+    print("mean bank after 100 games {:.0f}".format(banks.mean()))
+    start = time.perf_counter()
+    result = simulate_sharded(10 ** 7, seed=0, players=10000, games=100)
+    elapsed = time.perf_counter() - start
+    print("{} hands in {:.2f}s on {} cores ({:.0f} hands/s)".format(result.hands, elapsed, os.cpu_count(),
+                                                                    result.hands / elapsed))
+    print("house edge {:.4f} +/- {:.4f}".format(result.house_edge(100), result.standard_error(100)))
+
+
+if __name__ == "__main__":
+    test()
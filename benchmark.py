@@ -0,0 +1,272 @@
+"""
+Project Name: blackjack-bot
+File Name: benchmark.py
+
+Description: Times the hot paths of the game logic and compares the results with a saved baseline to catch regressions.
+"""
+
+import argparse
+import card
+import collections
+import database as _database
+import dealer as _dealer
+import engine
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import shoe as _shoe
+import statistics
+import sys
+import table as _table
+import tempfile
+import time
+import timeit
+
+TABLE_SIZES = (1, 10, 100, 1000)
+SEED = 1234
+DRAWS = 300
+
+# run the stateful benchmarks this many times, every run on a freshly prepared table
+SAMPLES = 200
+# a benchmark is flagged when its fastest time is this fraction slower than the baseline, the fastest time being the
+# least disturbed by the rest of the machine
+THRESHOLD = 0.10
+
+
+class NoHistory:
+    """
+    Stands in for a 'HistoryWriter' and records nothing, so the benchmarks time the game logic and not the history
+    queue.
+    """
+
+    def new_session(self):
+        return 0
+
+    def record(self, *event):
+        pass
+
+
+class BenchmarkClient:
+    """
+    Holds what a 'Table' needs from 'BlackJackBot' to play games, without a Discord connection.
+
+    Attributes:
+        user | :class: 'ScriptedMember'
+            The member of the dealer
+        history | :class: 'NoHistory'
+            Takes the history of the benchmark tables, which is not recorded
+    """
+
+    def __init__(self):
+        self.user = engine.ScriptedMember("dealer")
+        self.history = NoHistory()
+
+
+def repeat(statement, repeats=7):
+    """
+    Times a statement with timeit, running it often enough per repeat that a repeat takes at least 0.2 seconds.
+    :param statement: callable to time
+    :param repeats: int number of repeats
+    :return: list of float seconds per call, one for every repeat
+    """
+    timer = timeit.Timer(statement)
+    number, _ = timer.autorange()
+    return [total / number for total in timer.repeat(repeats, number)]
+
+
+def sample(setup, statement, samples=SAMPLES):
+    """
+    Times a statement that changes state, preparing the state with setup before every call. Setup is not timed and
+    the garbage collector is off while timing, as in timeit.
+    :param setup: callable preparing a run, its result is passed to statement
+    :param statement: callable to time
+    :param samples: int number of runs
+    :return: list of float seconds per call, one for every run
+    """
+    times = list()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(samples):
+            prepared = setup()
+            start = time.perf_counter()
+            statement(prepared)
+            times.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return times
+
+
+def new_shoe(cards):
+    """
+    :param cards: int number of cards a benchmark draws before its shoe is rewound
+    :return: 'Shoe' with the benchmark's own seed and enough decks that it is never shuffled while drawing
+    """
+    return _shoe.Shoe(decks=cards // 52 + 2, penetration=1, seed=SEED)
+
+
+def new_table(client, size):
+    table = _table.Table(client, collections.namedtuple("Channel", "id server")("benchmark", None))
+    table.shoe = new_shoe(size * 4 + 20)
+    for i in range(size):
+        table.players.add(engine.ScriptedUser(i))
+    return table
+
+
+def ready_game(table):
+    """
+    Prepares a table for evaluation: the shoe is rewound, every player bets and is dealt a hand, then players below 17
+    hit once. Every game prepared for a table is therefore the same.
+    """
+    table.shoe.position = 0
+    table.reset_players()
+    table.force_bet()
+    table.deal_cards()
+    for player in table.players:
+        if player.best_value < 17:
+            player.hit()
+        else:
+            player.hold()
+    table.evaluate_players()
+    return table
+
+
+def benchmarks(directory):
+    """
+    :param directory: str temporary directory for the files written by the benchmarks
+    :return: generator of (name, callable) tuples, where calling the callable runs the benchmark and returns a list of
+             float seconds per call
+    """
+    yield "card.create_deck", lambda: repeat(card.Card.create_deck)
+
+    shoe = new_shoe(DRAWS)
+    def draw_shoe():
+        shoe.position = 0
+        for _ in range(DRAWS):
+            shoe.draw()
+    yield "shoe.draw", lambda: [seconds / DRAWS for seconds in repeat(draw_shoe)]
+
+    shoe = new_shoe(3000)
+    hands = list()
+    for i in range(1000):
+        player = engine.ScriptedUser(i)
+        player.deal(shoe)
+        if i % 2:
+            player.add_card(shoe.draw())
+        hands.append(player)
+    yield "player.get_hand_values[1000]", lambda: repeat(lambda: [player.get_hand_values() for player in hands])
+    yield "player.is_bust[1000]", lambda: repeat(lambda: [player.is_bust() for player in hands])
+    yield "player.has_blackjack[1000]", lambda: repeat(lambda: [player.has_blackjack() for player in hands])
+
+    dealer = _dealer.Dealer(engine.ScriptedMember("dealer"))
+    dealer_shoe = new_shoe(520)
+    def time_dealer():
+        positions = itertools.cycle(range(0, 500, 5)) # every run deals the same 100 hands over and over
+        def ready_dealer():
+            dealer_shoe.position = next(positions)
+            dealer.reset()
+            dealer.deal(dealer_shoe)
+            return dealer
+        return sample(ready_dealer, _dealer.Dealer.hit_until_hold, SAMPLES * 10)
+    yield "dealer.hit_until_hold", time_dealer
+
+    client = BenchmarkClient()
+    for size in TABLE_SIZES:
+        table = new_table(client, size)
+        yield "table.evaluate_game[{}]".format(size), lambda: sample(lambda: ready_game(table), _table.Table.evaluate_game)
+        ready_game(table)
+        yield "table.str_players_with_hand[{}]".format(size), lambda: repeat(table.str_players_with_hand)
+
+    db = _database.UserDatabase(os.path.join(directory, "users.db"))
+    users = [engine.ScriptedUser(i) for i in range(100)]
+    rng = random.Random(SEED)
+    def change_banks():
+        for player in users:
+            player.set_bank(rng.randrange(1000, 10000))
+            player.record_result(engine.WON, 100)
+        return users
+    yield "database.write_users[100]", lambda: sample(change_banks, db.write_users)
+    yield "database.load_user", lambda: repeat(lambda: db.load_user(users[rng.randrange(len(users))]))
+    yield "database.load_banks[100]", lambda: repeat(lambda: db.load_banks([player.id for player in users]))
+    db.close()
+
+
+def run(names=None):
+    """
+    Runs the benchmarks, printing each one as it finishes.
+    :param names: list of str substrings, only benchmarks whose name contains one of them are run, or None for all
+    :return: dict of benchmark names to dicts of the median, minimum and standard deviation in seconds per call
+    """
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for name, benchmark in benchmarks(directory):
+            if names and not any(part in name for part in names):
+                continue
+            times = benchmark()
+            results[name] = {"median": statistics.median(times), "min": min(times),
+                             "stdev": statistics.stdev(times) if len(times) > 1 else 0.0}
+            print("{:<40} {:>12} (min {}, stdev {})".format(name, format_time(results[name]["median"]),
+                                                           format_time(results[name]["min"]),
+                                                           format_time(results[name]["stdev"])))
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Compares the fastest times of results with a baseline, printing the change of every benchmark in both.
+    :param results: dict of results from run
+    :param baseline: dict of results from a saved run
+    :param threshold: float fraction a benchmark may be slower than the baseline before it is flagged
+    :return: list of str names of the benchmarks that regressed
+    """
+    regressions = list()
+    print("\n{:<40} {:>12} {:>12} {:>8}".format("benchmark", "baseline", "current", "change"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["min"], result["min"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<40} {:>12} {:>12} {:>+7.1%}{}".format(name, format_time(before), format_time(after), change, flag))
+    return regressions
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:.2f} {}".format(seconds / scale, unit)
+    return "{:.1f} ns".format(seconds / 1e-9)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Benchmarks the game logic of blackjack-bot.")
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="fraction slower than the baseline that counts as a regression (default %(default)s)")
+    options = parser.parse_args(args)
+    results = run(options.names)
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print("\n{} benchmarks regressed more than {:.0%}".format(len(regressions), options.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -29,14 +29,19 @@ The MIT License (MIT)
 Copyright (c) 2016 Connor York
 """
 
-import dealer as _dealer
-import user
+import argparse
+import asyncio
+import command as _command
+import database as _database
+import history as _history
+import metrics
+import outbox as _outbox
+import profiling
+import sys
+import table as _table
+import tracing
 import discord
 import logging
-import time
-import card
-import sqlite3
-import os.path
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -45,457 +50,252 @@ class BlackJackBot(discord.Client):
     Represents the bot user client for blackjack-bot to run on.
 
     Attributes:
-        INTERMISSION_TIME | int
-            The number of seconds that intermission lasts
-        BETTING_TIME | int
-            The number of seconds that players are allowed to bet
-        PLAYING_TIME | int
-            The number of seconds that players are allowed to player per
-        in_session | bool
-            States if there is a current session in progress. This is used to prevent access to certain commands
-            when a session is present or not present.
-        players | list of :class: 'User' from blackjack-bot, not discord.py
-            Iterable of all players currently playing in the game.
-        channel | :class: 'Channel'
-            The current channel which is used to input and output messages.
-        dealer | :class: 'Dealer'
-            The user that the client is connected to represented as a player in Blackjack
+        tables | dict of str to :class: 'Table'
+            The table of every channel that currently has a session in progress, keyed by channel id. A channel
+            without a table can start a new session.
+        outbox | :class: 'Outbox'
+            Sends and edits the messages of every table within Discord's rate limits
+        database | :class: 'AsyncUserDatabase'
+            Stores the banks and game results of users between sessions, without blocking the event loop
+        history | :class: 'HistoryWriter'
+            Records the events of every game to the hand-history log, in the background
+        admins | set of str
+            The ids of the members allowed to use admin commands such as '$metrics', read from ADMINS_FILE
+        profiler | :class: 'Profiler'
+            Profiles sessions or games when armed with the '$profile' admin command or the --profile option
+        metrics_server | :class: 'Server'
+            Serves the metrics in Prometheus' text format on METRICS_HOST:METRICS_PORT, None until it is started or
+            if METRICS_PORT is None
+        sessions | set of :class: 'Task'
+            The tasks running the session of every table
+        seats | dict of str to :class: 'Table'
+            The table every member playing blackjack sits at, keyed by member id. A member sits at one table at a
+            time, so the bank of a member is only ever changed by one table.
     """
 
-    INTERMISSION_TIME = 20
-    BETTING_TIME = 50
-    PLAYING_TIME = 120
-    MESSAGE_GAP = 10
-
     PREFIX = "$"
+    QUEUE_TIMEOUT = 30
+    LEADERBOARD_LENGTH = 10
+
+    ADMINS_FILE = "admins.txt"
+    METRICS_HOST = "127.0.0.1"
+    METRICS_PORT = 9100
 
     def __init__(self):
         super().__init__()
-        self.in_session = False
-        self.players = list()
-        self.channel = None
-        self.dealer = _dealer.Dealer(self.user)
-        if not os.path.isfile("users.db"):
-            file = open("users.db", 'a')
-            file.close()
-            self.sqlite_conn = sqlite3.connect("users.db")
-            self.conn_cursor = self.sqlite_conn.cursor()
-            self.conn_cursor.execute('''CREATE TABLE users (id text, bank integer)''')
-        else:
-            self.sqlite_conn = sqlite3.connect("users.db")
-            self.conn_cursor = self.sqlite_conn.cursor()
+        self.tables = dict()
+        self.outbox = _outbox.Outbox(self)
+        self.database = _database.AsyncUserDatabase("users.db", self.loop)
+        self.history = _history.HistoryWriter("history")
+        self.admins = load_admins(self.ADMINS_FILE)
+        self.profiler = profiling.Profiler()
+        self.metrics_server = None
+        self.sessions = set()
+        self.seats = dict()
+        metrics.registry.gauge("blackjack_tables", "Tables with a session in progress", function=lambda: len(self.tables))
+        metrics.registry.gauge("blackjack_players", "Players sitting at a table",
+                               function=lambda: sum(len(table.players) for table in self.tables.values()))
+        if self.METRICS_PORT is not None:
+            self.loop.create_task(self.serve_metrics())
 
 
     async def on_message(self, message):
 
         await self.wait_until_ready()
-        message_content = message.content.strip()
+        cmd = _command.Command.parse(message, self.PREFIX)
 
-        if not message_content.startswith(self.PREFIX):
+        if cmd is None:
             return
         if message.author == self.user:
             return
-        if not self.in_session: # if there is no current game, game commands should not be accessible
-            if message_content.startswith(self.PREFIX + "blackjack"): # start game command
-                self.in_session = True
-                self.channel = message.channel
-                await self.run_session()
-                self.in_session = False
-
-################################################################################################
-######################################### GAME METHODS #########################################
-################################################################################################
-
-    async def run_session(self):
-        await self.send_message(self.channel, "Blackjack game commencing. Creating table.")
-        time.sleep(self.MESSAGE_GAP)
-        game_counter = 0
-        while self.still_playing_session() or game_counter == 0:
-            await self.run_intermission()
-            if self.still_playing_session():
-                await self.print_players_with_bank()
-                time.sleep(self.MESSAGE_GAP)
-                await self.run_game()
-                for player in self.players: # updates database every round
-                    self.write_user(player)
-            game_counter += 1
-        await self.send_message(self.channel, "Session ending, destroying table. Thanks for playing!")
-        self.reset_bot()
-
-    async def run_game(self):
-        """
-        Runs the game, which is the time from after the bets have been placed, and the last player has finished
-        playing.
-        """
-        await self.run_betting()
-        self.force_bet()
-        await self.print_players_with_bet()
-        time.sleep(self.MESSAGE_GAP)
-        cards_msg = await self.send_message(self.channel, "Retrieving a new deck, shuffling, and dealing cards! Please hold!")
-        self.deal_cards()
-        time.sleep(self.MESSAGE_GAP)
-        await self.edit_message(cards_msg, cards_msg.content + "\n\n" + self.str_players_with_hand())
-        time.sleep(self.MESSAGE_GAP)
-        while self.still_playing_game():
-            await self.run_round()
-            self.ready_new_round_players()
-        await self.send_message(self.channel, "There are no more players eligible to play, so the game is over!"
-                                              " Here evaluation to see who won!\n" + self.evaluate_game())
-        time.sleep(self.MESSAGE_GAP)
-        await self.send_message(self.channel, "Resetting players for next game...")
-        time.sleep(self.MESSAGE_GAP)
-        self.reset_players()
-
-    async def run_betting(self):
-        start_time = time.clock()
-        await self.send_message(self.channel, "Betting commencing. Enter '{}bet #' with '#' replaced with your bet! All "
-                                              "bets must be between 100 and 500 memes.".format(self.PREFIX))
-        confirm_msg = None
-        while time.clock() - start_time < self.BETTING_TIME:
-
-            def msg_check(msg):
-                return msg.content.startswith(self.PREFIX + "bet")
-
-            bet_msg = await self.wait_for_message(timeout=self.BETTING_TIME, check=msg_check) if self.still_betting() else None
-            if bet_msg:
-                player = self.get_player(bet_msg.author)
-                if player: # if message author not in game, do nothing
-                    msg_content = bet_msg.content.strip(' ').split(' ')
-                    if len(msg_content) != 2:
-                        pass
-                    else:
-                        bet_amount = msg_content[1]
-                        if bet_amount.isdigit():
-                            if player.bet(int(bet_amount)):
-                                if not confirm_msg:
-                                    confirm_msg = await self.send_message(self.channel, "{} bet {} memes!".format(player.mention_user(),
-                                                                                           player.current_bet))
-                                else:
-                                    await self.edit_message(confirm_msg, confirm_msg.content + "\n\n" + "{} bet {} memes!".format(player.mention_user(), player.current_bet))
-                            else:
-                                if not confirm_msg:
-                                    confirm_msg = await self.send_message(self.channel,
-                                                        "Bet must be a positive integer between 100 and 500 memes that is less than the amount"
-                                                        " in your bank.\n You ({}) currently have {} memes.".format(
-                                                            player.mention_user(), player.bank))
-                                else:
-                                    await self.edit_message(confirm_msg, confirm_msg.content + "\n\n" +
-                                                        "Bet must be a positive integer between 100 and 500 memes that is less than the amount"
-                                                        " in your bank.\n You ({}) currently have {} memes.".format(
-                                                            player.mention_user(), player.bank))
-                        else:
-                            if not confirm_msg:
-                                confirm_msg = await self.send_message(self.channel,
-                                                    "Bet must be a positive integer between 100 and 500 memes that is less than the amount"
-                                                    " in your bank.\n You ({}) currently have {} memes.".format(
-                                                        player.mention_user(), player.bank))
-                            else:
-                                await self.edit_message(confirm_msg, confirm_msg.content + "\n\n" +
-                                                    "Bet must be a positive integer between 100 and 500 memes that is less than the amount"
-                                                    " in your bank.\n You ({}) currently have {} memes.".format(
-                                                        player.mention_user(), player.bank))
-
-
-    async def run_round(self):
-        start_time = time.clock()
-        await self.send_message(self.channel, "The round in commencing. Enter '{}hit' or '{}hold' to play!".format(self.PREFIX, self.PREFIX))
-        while time.clock() - start_time < self.PLAYING_TIME:
-
-            def msg_check(msg):
-                return msg.content.startswith(self.PREFIX + "hit") or msg.content.startswith(self.PREFIX + "hold")
-
-            play_msg = await self.wait_for_message(timeout=self.PLAYING_TIME, check=msg_check) if \
-                self.still_deciding() else None
-            if play_msg:
-                player = self.get_player(play_msg.author)
-                if player:
-                    if play_msg.content.startswith(self.PREFIX + "hit"):
-                        if player.hit(): #success
-                            await self.send_message(self.channel, "{} hit!".format(player.mention_user()))
-                        else:
-                            await self.send_message(self.channel, "{} can not hit!".format(player.mention_user()))
-                    elif play_msg.content.startswith(self.PREFIX + "hold"):
-                        if player.hold(): #success
-                            await self.send_message(self.channel, "{} held their hand!".format(player.mention_user()))
-                        else:
-                            await self.send_message(self.channel, "{} cannot hold! They may have already played or "
-                                                                  "are not playing this round. ".format(player.mention_user()))
-            else:
-                break
-        end_message = await self.send_message(self.channel, "Either all players played or the time is up! The round is now over. Preparing everyone for post round evaluation.")
-        time.sleep(self.MESSAGE_GAP)
-        forced_players = self.force_hold()
-        if forced_players:
-            end_message = await self.edit_message(end_message, end_message.content + "\n\n" + forced_players)
-            time.sleep(self.MESSAGE_GAP)
-        await self.edit_message(end_message, end_message.content + "\n\n" + "Here comes the new hands!")
-        time.sleep(self.MESSAGE_GAP)
-        await self.edit_message(end_message, end_message.content + "\n\n" + self.str_players_with_hand())
-        time.sleep(self.MESSAGE_GAP)
-        eval_message = await self.send_message(self.channel, "Running algorithms to evaluate players based on last round.")
-        time.sleep(self.MESSAGE_GAP)
-        busted = self.evaluate_players()
-        if busted:
-            await self.edit_message(eval_message, eval_message.content + "\n\n" + busted)
-
-    async def run_intermission(self):
-        start_time = time.clock()
-        await self.send_message(self.channel, "Intermission commencing. Type '{}join' to join the table or '{}quit' to leave!"
-                                              " All new players start with 5000 memes.".format(self.PREFIX, self.PREFIX))
-        confirm_msg = None
-        while time.clock() - start_time < self.INTERMISSION_TIME:
-
-            def msg_check(msg):
-                return msg.content.startswith(self.PREFIX + "join") or msg.content.startswith(self.PREFIX + "quit")
-
-            join_msg = await self.wait_for_message(timeout=self.INTERMISSION_TIME, check=msg_check) \
-                                                                    if time.clock() - start_time < self.INTERMISSION_TIME \
-                                                                    else None
-            if join_msg:
-                if join_msg.content.startswith(self.PREFIX + "join"):
-                    if self.get_player(join_msg.author) is None:
-                        self.players.append(user.User(join_msg.author))
-                        if not confirm_msg:
-                            confirm_msg = await self.send_message(self.channel, "{} joined!".format(self.get_player(join_msg.author).mention_user()))
-                        else:
-                            await self.edit_message(confirm_msg, confirm_msg.content + "\n\n" + "{} joined!".format(self.get_player(join_msg.author).mention_user()))
-                        self.load_user(self.get_player(join_msg.author))
-                elif join_msg.content.startswith(self.PREFIX + "quit"):
-                    player = self.get_player(join_msg.author)
-                    if player:
-                        self.players.remove(player)
-                        if not confirm_msg:
-                            confirm_msg = await self.send_message(self.channel, "{} quit!".format(player.mention_user()))
-                        else:
-                            await self.edit_message(confirm_msg, confirm_msg.content + "\n\n" + "{} quit!".format(player.mention_user()))
-                        self.write_user(player)
-        self.sqlite_conn.commit()
-
-################################################################################################
-######################################## HELPER METHODS ########################################
-################################################################################################
-
-    def deal_cards(self):
-        """
-        Creates a new deck and deals 2 cards to every player, including the dealer.
-        """
-        card.Card.create_deck()
-        self.dealer.deal()
-        for player in self.players:
-            player.deal()
-
-    def evaluate_players(self):
-        #check each player to see if they have busted and update their variables
-        message = ""
-        for player in self.players:
-            if isinstance(player, user.User):
-                if player.is_playing and player.is_bust():
-                    message += "    " + player.mention_user()
-                    player.bust()
-        if message:
-            return "Busted players:\n\n" + message
-
-    def evaluate_game(self):
-        """
-        Determines the winners and losers of the game. This method is called at the end of the game to create a str
-        representation of the end game statistics and to edit the banks of the players in the game.
-        :return: str representing the end game stats
-        """
-        self.dealer.hit_until_hold()
-        message = self.bold_message(self.dealer.final_str_with_hand()+ "\n")
-        if self.dealer.has_blackjack():
-            message += "The Dealer has Blackjack. All players without blackjack will lose the round.\n\n"
-            for player in self.players:
-                if not player.has_blackjack():
-                    message += "    " + player.mention_user() + " lost " + self.bold_message(str(player.lose_bet())) + " memes\n"
-                else:
-                    message += "    " + player.mention_user() + " also had blackjack so they gained/lost no memes.\n"
-        elif self.dealer.is_bust():
-            message += "The Dealer is busted. All players left in the game win.\n\n"
-            for player in self.players:
-                if player.is_busted or player.is_bust():
-                    message += "    " + player.mention_user() + " lost " + self.bold_message(str(player.lose_bet())) + " memes\n"
-                else:
-                    message += "    " + player.mention_user() + " won " + self.bold_message(str(player.gain_bet())) + " memes\n"
-        else:
-            # players with a higher point total win, players with a lower point total than dealer lose
-            dealer_hand_value = min(i for i in self.dealer.get_hand_values())
-            message += "The Dealer has a hand value of {}. All non-busted players above this value win!\n\n".format(dealer_hand_value)
-            for player in self.players:
-                player_hand_value = min(i for i in player.get_hand_values())
-                for value in player.get_hand_values(): # picks the largest value below 21 as the value to use when comparing
-                    if 21 >= value > player_hand_value:
-                        player_hand_value = value
-                if not player.is_bust() and player_hand_value > dealer_hand_value:
-                    message += "    " + player.mention_user() + " won " + self.bold_message(str(player.gain_bet())) + " memes\n"
-                elif not player.is_bust() and player_hand_value == dealer_hand_value:
-                    message += "    " + player.mention_user() + " tied and gained/lost no memes.\n"
-                else:
-                    message += "    " + player.mention_user() + " lost " + self.bold_message(str(player.lose_bet())) + " memes\n"
-        return message
-
-    def reset_bot(self):
-        """
-        Resets the bot client's state to initial values, preparing it for a new session.
-        """
-        self.players.clear()
-        self.channel = None
-        self.dealer = _dealer.Dealer(self.user)
-
-    def reset_players(self):
-        """
-        Resets the state of all players to initial values.
-        """
-        self.dealer.reset()
-        for player in self.players:
-            player.reset()
-            if player.bank <= 500:
-                player.set_bank(1000)
-
-    def force_hold(self):
-        """
-        Forces players who did not input a command for the round to hold.
-        :return: str stating the players that did not respond
-        """
-        names = ""
-        for player in self.players:
-            if isinstance(player, user.User):
-                if not player.has_played:
-                    player.hold()
-                    names += player.mention_user() + ","
-        if names:
-            return "Forced {} to hold because they took too long to decide last round.".format(names)
-
-    def force_bet(self):
-        names = ""
-        for player in self.players:
-            if player.current_bet == 0:
-                player.bet(100)
-                names += player.mention_user() + ","
-        if names:
-            return "Forced {} to bet because they took too long to bet.".format(names)
-
-    def ready_new_round_players(self):
+        if cmd.name == "leaderboard":
+            await self.send_leaderboard(message.channel, cmd.args)
+            cmd.handled()
+            return
+        if cmd.name == "stats":
+            await self.send_stats(message.channel, message.author)
+            cmd.handled()
+            return
+        if cmd.name == "metrics":
+            if message.author.id in self.admins:
+                await self.send_metrics(message.channel)
+                cmd.handled()
+            return
+        if cmd.name == "profile":
+            if message.author.id in self.admins:
+                await self.send_profile(message.channel, cmd.args)
+                cmd.handled()
+            return
+        table = self.tables.get(message.channel.id)
+        if table is None: # if there is no current game, game commands should not be accessible
+            if cmd.name == "blackjack": # start game command
+                table = _table.Table(self, message.channel)
+                self.tables[message.channel.id] = table
+                session = self.loop.create_task(self.run_table(table))
+                self.sessions.add(session)
+                session.add_done_callback(self.sessions.discard)
+                cmd.handled()
+        elif cmd.name in _command.Command.NAMES:
+            # waits while the table's queue is full, so a flooded channel slows down instead of losing commands
+            try:
+                await asyncio.wait_for(table.commands.put(cmd), self.QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                cmd.handled("dropped")
+                logging.warning("Dropped '%s' in channel %s, the table is not taking commands", cmd.name, table.channel.id)
+
+    async def run_table(self, table):
         """
-        Resets valid player's 'has_played' variable so that they are allowed to play in the next round
+        Runs the session of a table, removing the table once the session is over so the channel can start a new one.
+        :param table: 'Table' to run
         """
-        for player in self.players:
-            if player.is_playing:
-                player.has_played = False
-
-    def still_playing_session(self):
+        try:
+            with self.profiler.profile("session", table.channel.id), tracing.span("session", table=table.channel.id):
+                await table.run_session()
+        finally:
+            table.free_seats()
+            del self.tables[table.channel.id]
+            self.outbox.forget(table.channel)
+
+    async def send_leaderboard(self, channel, args):
         """
-        Determines if there are still players playing blackjack
-        :return: True if there are still players playing, False otherwise
+        Sends the top players of the channel's server, ranked by bank, or by net winnings with '$leaderboard net'.
+        :param channel: discord.py :class: 'Channel' the command was sent in
+        :param args: list of str arguments of the command
         """
-        return len(self.players) != 0
+        order = "net" if args and args[0].lower() == "net" else "bank"
+        rows = await self.database.leaderboard(_table.guild_id(channel), self.LEADERBOARD_LENGTH, order)
+        if not rows:
+            await self.outbox.send(channel, "Nobody has played blackjack here yet.")
+            return
+        lines = ["**Leaderboard by {}:**".format("net winnings" if order == "net" else "bank")]
+        for rank, (user_id, bank, net) in enumerate(rows, 1):
+            lines.append("{}. <@{}> bank: {} memes, net: {:+d} memes".format(rank, user_id, bank, net))
+        await self.outbox.send(channel, "\n".join(lines))
 
-    def still_playing_game(self):
+    async def send_stats(self, channel, member):
         """
-        Determines if there are still players that are eligible to play in a round. This means that they are not
-        holding or busted.
-        :return: True if there are still eligible players, False if not
+        Sends the saved game results of a member.
+        :param channel: discord.py :class: 'Channel' the command was sent in
+        :param member: discord.py :class: 'Member' that asked for their stats
         """
-        for player in self.players:
-            if player.is_playing:
-                return True
-        return False
+        stats = await self.database.load_stats(member.id)
+        if stats is None:
+            await self.outbox.send(channel, "<@{}> has not played any games yet.".format(member.id))
+            return
+        await self.outbox.send(channel, "<@{}> bank: {bank} memes, net: {net:+d} memes\n"
+                                        "hands: {hands}, won: {wins}, lost: {losses}, tied: {pushes}, blackjacks: {blackjacks}"
+                                        .format(member.id, **stats))
 
-    def still_deciding(self):
+    async def send_metrics(self, channel):
         """
-        Determines if the decision time is still in action, meaning that players still have not hit or held their hand.
-        :return: Whether or not there are players that have not decided what to do (hit or hold)
+        Sends the summary of the metrics in code blocks, split so that every message holds a whole block.
+        :param channel: 'Channel' to send the summary in
         """
-        for player in self.players:
-            if isinstance(player, user.User):
-                if not player.has_played:
-                    return True
-        return False
+        fence = "```\n{}\n```"
+        for part in _outbox.split_content(metrics.registry.summary(), _outbox.MESSAGE_LIMIT - len(fence.format(""))):
+            await self.outbox.send(channel, fence.format(part))
 
-    def still_betting(self):
+    async def send_profile(self, channel, args):
         """
-        Determines if there are still players in the game who have not bet.
-        :return: True if there are currently players with no bet, False otherwise
+        Arms the profiler with '$profile <count> [session|game] [every]', or turns it off with '$profile off'.
+        :param channel: discord.py :class: 'Channel' the command was sent in
+        :param args: list of str arguments of the command
         """
-        for player in self.players:
-            if player.current_bet is 0:
-                return True
-        return False
-
-    def get_player(self, member):
-        for player in self.players:
-            if player.id == member.id:
-                return player
-        return None
-
-###############################################################################################
-######################################## PRINT METHODS ########################################
-###############################################################################################
+        usage = "Usage: {0}profile <count> [session|game] [every], or {0}profile off".format(self.PREFIX)
+        if args[:1] == ["off"]:
+            self.profiler.arm(0)
+            await self.outbox.send(channel, "Profiling is off.")
+            return
+        if not args or not args[0].isdigit() or (len(args) > 2 and not args[2].isdigit()):
+            await self.outbox.send(channel, usage)
+            return
+        target = args[1].lower() if len(args) > 1 else "game"
+        if target not in profiling.TARGETS:
+            await self.outbox.send(channel, usage)
+            return
+        every = int(args[2]) if len(args) > 2 else 1
+        self.profiler.arm(int(args[0]), target, every)
+        await self.outbox.send(channel, "Profiling the next {} {}s (one in every {}), writing to '{}'.".format(
+            args[0], target, every, self.profiler.directory))
 
-    def str_players_with_hand(self):
+    async def serve_metrics(self):
         """
-        Creates a str of all the players in the session with their hands.
-        This does not send a message.
-        :return: str of players with their hands
+        Starts serving the metrics over HTTP. The bot keeps running without them if the port is taken.
         """
-        message = "Players and their hands\n\n" + self.bold_message(self.dealer.str_with_hand()) + "\n"
-        for player in self.players:
-            if isinstance(player, user.User):
-                message += player.str_with_hand() + "\n"
-        return message
-
-    async def print_players_with_bet(self):
-        bet_msg = await self.send_message(self.channel, "Here comes everyone's bets for the round!")
-        time.sleep(self.MESSAGE_GAP)
-        message = "Players and their bets\n\n"
-        for player in self.players:
-            if isinstance(player, user.User):
-                message += player.str_with_bet() + "\n"
-        await self.edit_message(bet_msg, bet_msg.content + "\n\n" + message)
-
-    async def print_players_with_bank(self):
-        message = "Players and their banks\n\n"
-        for player in self.players:
-            if isinstance(player, user.User):
-                message += player.str_with_bank() + "\n"
-        await  self.send_message(self.channel, message)
-
-###############################################################################################
-###################################### DATABASE METHODS #######################################
-###############################################################################################
+        try:
+            self.metrics_server = await metrics.serve(metrics.registry, self.METRICS_HOST, self.METRICS_PORT)
+        except OSError:
+            logging.exception("Could not serve metrics on port %s", self.METRICS_PORT)
 
-    def write_user(self, _user):
+    def run(self, token):
         """
-        Updates the user's bank value to it's current value
-        :param _user: 'User' class object to update bank value of
+        Runs the bot until it is disconnected or interrupted, then shuts it down so that nothing still queued is lost.
+        :param token: str token of the bot's account
         """
         try:
-            self.conn_cursor.execute("INSERT INTO users (id,bank) VALUES (?, ?)", (_user.id, _user.bank))
-        except sqlite3.IntegrityError:
+            self.loop.run_until_complete(self.start(token))
+        except KeyboardInterrupt:
             pass
-        self.conn_cursor.execute("UPDATE users SET bank=? WHERE id=?", (_user.bank, _user.id ))
+        finally:
+            self.loop.run_until_complete(self.shutdown())
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
 
-    def load_user(self, _user):
+    async def shutdown(self):
         """
-        If the user is in the database, loads the bank value from the database as the user's current bank
-        :param _user: 'User' class object to update bank value of
+        Says goodbye to every table and stops their sessions, then saves the banks and stats, hand history and trace
+        events that are still queued before logging out.
         """
-        self.conn_cursor.execute("SELECT bank FROM users WHERE id=?", (_user.id,))
-        data = self.conn_cursor.fetchone()
-        if data:
-            _user.set_bank(int(data[0]))
-
-    @staticmethod
-    def bold_message(message):
-        return "**{}**".format(message)
-
-    async def shutdown(self):
-        await self.send_message(self.channel, "Bye!")
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        for table in list(self.tables.values()):
+            await self.outbox.send(table.channel, "Bye!")
+        sessions = list(self.sessions)
+        for session in sessions:
+            session.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+        await self.database.shutdown()
+        await self.loop.run_in_executor(None, self.history.close)
+        await self.loop.run_in_executor(None, tracing.tracer.stop)
         await self.logout()
 
-token_file = open("token.txt", "r")
-token = token_file.readline().strip()
-token_file.close()
+def load_admins(path):
+    """
+    :param path: str path of a file with the id of one admin on every line
+    :return: set of str ids of the admins, empty if the file does not exist
+    """
+    try:
+        with open(path, "r") as admins_file:
+            return {line.strip() for line in admins_file if line.strip()}
+    except FileNotFoundError:
+        return set()
 
-client = BlackJackBot()
-client.run(token)
\ No newline at end of file
+def parse_options(args):
+    """
+    :param args: list of str command line arguments
+    :return: 'Namespace' of the start-up options
+    """
+    parser = argparse.ArgumentParser(description="Runs blackjack-bot.")
+    parser.add_argument("--profile", type=int, default=0, metavar="COUNT",
+                        help="profile the first COUNT runs (see profiling.py)")
+    parser.add_argument("--profile-target", choices=profiling.TARGETS, default="game",
+                        help="profile whole sessions or single games (default %(default)s)")
+    parser.add_argument("--profile-every", type=int, default=1, metavar="N", help="only profile one in every N runs")
+    parser.add_argument("--trace", metavar="DIRECTORY",
+                        help="record spans of every table to Chrome trace files in DIRECTORY (see tracing.py)")
+    return parser.parse_args(args)
+
+if __name__ == "__main__":
+    options = parse_options(sys.argv[1:])
+    token_file = open("token.txt", "r")
+    token = token_file.readline().strip()
+    token_file.close()
+
+    if options.trace:
+        tracing.tracer.start(options.trace)
+    client = BlackJackBot()
+    client.profiler.arm(options.profile, options.profile_target, options.profile_every)
+    client.run(token)
@@ -28,19 +28,23 @@ The MIT License (MIT)
 Copyright (c) 2016 Connor York
 """
 
-from random import randint
-
 class Card:
     """
     Represents a playing card in a deck of cards.
 
+    There are only ever 52 Card objects, one for every card of a standard deck, which are created when this module is
+    loaded and shared by every deck, shoe and hand. Cards are immutable and can be stored as their code, a small int
+    that indexes DECK, so a list of cards can also be kept as bytes.
+
     Attributes:
         SUITES | list of str
             The string literals of the suites in a 52 card deck of playing cards
         CARDS | list of str
             The string literals of the types of cards in a 52 card deck of playing cards
-        deck | list of :class: 'Card'
-            Iterable of Card objects that have not been removed from the current deck.
+        DECK | tuple of :class: 'Card'
+            The 52 cards in the order of their codes, suite by suite
+        code | int
+            Number from 0 to 51 that uniquely identifies the card, suite index * 13 + card index
         value | int
             Number value of the current Card in the game Blackjack
         suite | str
@@ -49,59 +53,78 @@ class Card:
             Definition of the card in common playing card terms e.g. 'Ace of Hearts'
     """
 
+    __slots__ = ("code", "value", "suite", "name")
+
     SUITES = ["Hearts", "Clubs", "Spades", "Diamonds"]
 
     CARDS = ['Ace', 'Two', 'Three', 'Four',
              'Five', 'Six', 'Seven', 'Eight',
              'Nine', 'Ten', 'Jack', 'Queen', 'King']
 
-    deck = list()
+    DECK = ()
 
-    def __init__(self, value, suite, card):
-        self.value = value
-        self.suite = suite
-        self.name = card + " of " + suite
+    def __init__(self, code):
+        suite = Card.SUITES[code // len(Card.CARDS)]
+        rank = code % len(Card.CARDS)
+        object.__setattr__(self, "code", code)
+        object.__setattr__(self, "value", min(rank + 1, 10))
+        object.__setattr__(self, "suite", suite)
+        object.__setattr__(self, "name", Card.CARDS[rank] + " of " + suite)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Card objects are immutable")
 
     def __str__(self):
         return self.name
 
+    def __repr__(self):
+        return "Card({})".format(self.code)
+
+    def __reduce__(self):
+        # unpickles to the interned card instead of a copy
+        return Card.from_code, (self.code,)
+
     @staticmethod
-    def create_deck():
+    def from_code(code):
         """
-        Creates an ordered deck of 52 standard playing cards.
+        :param code: int code of a card
+        :return: the interned Card object with that code
+        """
+        return Card.DECK[code]
+
+    @staticmethod
+    def encode(cards):
+        """
+        :param cards: iterable of Card objects
+        :return: bytes holding the code of every card
         """
-        Card.clear_deck()
-        for suite in Card.SUITES:
-            value = 1
-            for card in Card.CARDS:
-                Card.deck.append(Card(value, suite, card))
-                if value < 10:
-                    value += 1
+        return bytes(c.code for c in cards)
 
     @staticmethod
-    def clear_deck():
-        Card.deck.clear()
+    def decode(codes):
+        """
+        :param codes: bytes or iterable of int codes
+        :return: list of the Card objects with those codes
+        """
+        return [Card.DECK[code] for code in codes]
 
     @staticmethod
-    def draw_card():
+    def create_deck():
         """
-        Draws a random Card from the deck.
-        :return: Card object
+        Creates an ordered deck of 52 standard playing cards.
+        :return: list of Card objects
         """
-        if len(Card.deck) == 0:
-            Card.create_deck()
-        return Card.deck.pop(randint(0, len(Card.deck) - 1))
+        return list(Card.DECK)
+
+
+Card.DECK = tuple(Card(code) for code in range(len(Card.SUITES) * len(Card.CARDS)))
 
 
 def test():
-    Card.create_deck()
-    for _ in Card.deck:
+    for _ in Card.create_deck():
         print(_)
 
 
 
 if __name__ == "__main__":
     test()
-    print("\n\n\n")
-    for _ in range(0,52):
-        print(Card.draw_card())
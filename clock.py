@@ -0,0 +1,155 @@
+"""
+Project Name: blackjack-bot
+File Name: clock.py
+
+Description: A virtual clock and an asyncio event loop that runs on it, so that load and soak tests play hours of
+    games in seconds.
+"""
+
+import asyncio
+
+class VirtualClock:
+    """
+    A clock that only moves when it is told to.
+
+    Parameters:
+        start | float
+            The time the clock starts at
+
+    Attributes:
+        now | float
+            The current time of the clock, in seconds
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def advance_to(self, when):
+        """
+        Moves the clock forward to a time, or leaves it if the time has passed.
+        :param when: float time to move to
+        """
+        if when > self.now:
+            self.now = when
+
+
+class VirtualSelector:
+    """
+    Wraps the selector of a 'VirtualTimeLoop'. When the loop would wait for its next timer and nothing is ready, the
+    clock jumps to the time of the timer instead of waiting for it, so sleeps and timeouts take no real time. The
+    clock is set to the timer's time rather than moved by the timeout, which could round to no move at all.
+
+    While work sent to an executor is running, the loop waits for it for real first (at most MAX_REAL_WAIT seconds),
+    so results from threads, such as the database's, arrive at the virtual time they were asked for.
+    """
+
+    MAX_REAL_WAIT = 1.0
+
+    def __init__(self, selector, loop):
+        self.selector = selector
+        self.loop = loop
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None: # nothing is scheduled, only another thread can wake the loop
+            return self.selector.select(None)
+        if self.loop.executor_running: # threads answer before the clock moves on
+            events = self.selector.select(min(timeout, self.MAX_REAL_WAIT))
+            if events:
+                return events
+        self.loop.clock.advance_to(self.loop.next_timer())
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop that runs on a 'VirtualClock'. Everything timed through the loop (asyncio.sleep, asyncio.wait_for,
+    call_later and the loop's time(), which 'Phase' and 'TokenBucket' read) follows the virtual clock, so a table
+    plays with its real phase times but a day of play takes as long as the code does to run. A timer never runs
+    before its time on the clock, even when the loop runs it early by less than its clock resolution.
+
+    Parameters:
+        clock | :class: 'VirtualClock'
+            The clock of the loop, a new one starting at 0 if None
+
+    Attributes:
+        executor_running | int
+            The number of calls sent to an executor that have not finished
+    """
+
+    def __init__(self, clock=None):
+        super().__init__()
+        self.clock = clock if clock is not None else VirtualClock()
+        self.executor_running = 0
+        self._selector = VirtualSelector(self._selector, self)
+
+    def time(self):
+        return self.clock.time()
+
+    def call_at(self, when, callback, *args, context=None):
+        # the loop runs timers up to its clock resolution early, which would not move the clock
+        return super().call_at(when, self._call_timer, when, callback, *args, context=context)
+
+    def _call_timer(self, when, callback, *args):
+        self.clock.advance_to(when)
+        callback(*args)
+
+    def next_timer(self):
+        """
+        :return: float time of the earliest timer, or the current time if there is none
+        """
+        # the loop drops cancelled timers from the head of its heap before it selects
+        if self._scheduled:
+            return self._scheduled[0].when()
+        return self.time()
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self.executor_running += 1
+        future.add_done_callback(self._executor_done)
+        return future
+
+    def _executor_done(self, future):
+        self.executor_running -= 1
+
+
+def run(coroutine, clock=None):
+    """
+    Runs a coroutine to completion on a new 'VirtualTimeLoop', like asyncio.run.
+    :param coroutine: coroutine to run
+    :param clock: 'VirtualClock' of the loop, or None
+    :return: the result of the coroutine
+    """
+    loop = VirtualTimeLoop(clock)
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test():
+    import time
+    async def sleeper():
+        await asyncio.sleep(3600)
+        return asyncio.get_event_loop().time()
+    start = time.perf_counter()
+    print("slept until {:.0f} virtual seconds in {:.4f} real seconds".format(run(sleeper()), time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    test()
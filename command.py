@@ -0,0 +1,73 @@
+"""
+Project Name: blackjack-bot
+File Name: command.py
+
+Description: Parses chat messages into commands and measures how long each command takes to be handled.
+"""
+
+
+import metrics
+import time
+
+COMMANDS = metrics.registry.counter("blackjack_commands_total", "Commands received, by command and what happened to them",
+                                    ("command", "outcome"))
+COMMAND_SECONDS = metrics.registry.histogram("blackjack_command_seconds", "Seconds from a command arriving to it being "
+                                             "taken up by its table or answered by the bot", ("command",))
+
+class Command:
+    """
+    Represents a command typed in chat, parsed once when the message arrives.
+
+    Parameters:
+        name | str
+            The name of the command without the prefix, e.g. 'bet'
+        args | list of str
+            The words following the name
+        author | :class: 'Member'
+            The member that sent the command
+        channel | :class: 'Channel'
+            The channel the command was sent in
+
+    Attributes:
+        received | float
+            The time.perf_counter() time the command was parsed at
+        NAMES | frozenset of str
+            The names of the commands that are routed to a table
+    """
+
+    __slots__ = ("name", "args", "author", "channel", "received")
+
+    NAMES = frozenset(("join", "quit", "bet", "hit", "hold", "hint"))
+
+    def __init__(self, name, args, author, channel):
+        self.name = name
+        self.args = args
+        self.author = author
+        self.channel = channel
+        self.received = time.perf_counter()
+
+    @staticmethod
+    def parse(message, prefix):
+        """
+        Parses a message into a Command.
+        :param message: discord.py :class: 'Message' to parse
+        :param prefix: str that every command starts with
+        :return: Command, or None if the message is not a command
+        """
+        content = message.content.strip()
+        if not content.startswith(prefix):
+            return None
+        words = content[len(prefix):].split()
+        if not words:
+            return None
+        return Command(words[0].lower(), words[1:], message.author, message.channel)
+
+    def handled(self, outcome="handled"):
+        """
+        Records the time the command took to be taken up, and what happened to it.
+        :param outcome: str 'handled', 'ignored' if it arrived outside of its phase or 'dropped' if its table's queue
+                        was full
+        """
+        COMMANDS.labels(self.name, outcome).inc()
+        if outcome == "handled":
+            COMMAND_SECONDS.labels(self.name).observe(time.perf_counter() - self.received)
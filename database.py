@@ -0,0 +1,381 @@
+"""
+Project Name: blackjack-bot
+File Name: database.py
+
+Description: Stores the banks and game results of users in SQLite, directly or from a dedicated thread behind a
+    write-behind queue.
+"""
+
+
+import asyncio
+import logging
+import metrics
+import sqlite3
+import tracing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# the game results counted for every user, in the order of the columns of the users table
+STATS = ("hands", "wins", "losses", "pushes", "blackjacks", "net")
+
+DATABASE_SECONDS = metrics.registry.histogram("blackjack_database_seconds", "Seconds a database call took, including "
+                                              "waiting for the database thread", ("operation",))
+
+class UserDatabase:
+    """
+    Stores the bank and game results of every user in a SQLite database.
+
+    The database runs in WAL journal mode, and the banks of all players of a game are written with a single UPSERT
+    in one transaction, so saving a game costs one small transaction no matter how many players there are. Game
+    results are stored as running totals that every save adds to.
+
+    The members table records the guilds every user played in, with a copy of their bank and their net winnings in
+    that guild, so that the leaderboard of a guild is read straight from an index instead of sorting every user.
+
+    Parameters:
+        path | str
+            Path of the database file, which is created if it does not exist
+
+    Attributes:
+        QUERY_BATCH | int
+            The largest number of ids looked up in one query, below SQLite's limit on query parameters
+        conn | :class: 'Connection'
+            The connection to the database
+    """
+
+    QUERY_BATCH = 500
+
+    def __init__(self, path="users.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.migrate()
+
+    def migrate(self):
+        """
+        Creates the users table, or rebuilds a table from an older version of blackjack-bot that has no primary key.
+        Those tables hold a row for every time a user was saved, of which only the most recent one is kept.
+        """
+        columns = self.conn.execute("PRAGMA table_info(users)").fetchall()
+        if not columns:
+            with self.conn:
+                self.conn.execute("CREATE TABLE users (id TEXT PRIMARY KEY, bank INTEGER NOT NULL)")
+        elif not any(column[1] == "id" and column[5] for column in columns): # column[5] is the primary key flag
+            with self.conn:
+                self.conn.execute("CREATE TABLE users_migrated (id TEXT PRIMARY KEY, bank INTEGER NOT NULL)")
+                self.conn.execute("INSERT INTO users_migrated (id, bank) "
+                                  "SELECT id, bank FROM users WHERE rowid IN (SELECT MAX(rowid) FROM users GROUP BY id)")
+                self.conn.execute("DROP TABLE users")
+                self.conn.execute("ALTER TABLE users_migrated RENAME TO users")
+        columns = [column[1] for column in self.conn.execute("PRAGMA table_info(users)").fetchall()]
+        with self.conn:
+            for stat in STATS:
+                if stat not in columns:
+                    self.conn.execute("ALTER TABLE users ADD COLUMN {} INTEGER NOT NULL DEFAULT 0".format(stat))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS users_bank ON users (bank)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS users_net ON users (net)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS members (guild_id TEXT NOT NULL, user_id TEXT NOT NULL, "
+                              "bank INTEGER NOT NULL DEFAULT 0, net INTEGER NOT NULL DEFAULT 0, "
+                              "PRIMARY KEY (guild_id, user_id)) WITHOUT ROWID")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS members_user ON members (user_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS members_bank ON members (guild_id, bank)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS members_net ON members (guild_id, net)")
+
+    def load_user(self, _user):
+        """
+        If the user is in the database, loads the bank value from the database as the user's current bank
+        :param _user: 'User' class object to update bank value of
+        """
+        bank = self.load_bank(_user.id)
+        if bank is not None:
+            _user.set_bank(bank)
+
+    def write_users(self, users, guild_id=None):
+        """
+        Saves the current bank and the unsaved game results of every user in one transaction.
+        :param users: iterable of 'User' objects to save
+        :param guild_id: str id of the guild the users played in, or None
+        """
+        rows = [(_user.id, _user.bank) + _user.take_stats() for _user in users]
+        members = [(guild_id, row[0], row[-1]) for row in rows] if guild_id is not None else ()
+        self.write_rows(rows, members)
+
+    def load_bank(self, user_id):
+        """
+        :param user_id: str id of a user
+        :return: int bank of the user, or None if the user is not in the database
+        """
+        data = self.conn.execute("SELECT bank FROM users WHERE id=?", (user_id,)).fetchone()
+        return int(data[0]) if data else None
+
+    def load_banks(self, user_ids):
+        """
+        Looks up many users with as few queries as possible.
+        :param user_ids: list of str ids of users
+        :return: dict of id to int bank of every user that is in the database
+        """
+        banks = dict()
+        for i in range(0, len(user_ids), self.QUERY_BATCH):
+            batch = user_ids[i:i + self.QUERY_BATCH]
+            rows = self.conn.execute("SELECT id, bank FROM users WHERE id IN ({})".format(",".join("?" * len(batch))),
+                                     batch)
+            banks.update((user_id, int(bank)) for user_id, bank in rows)
+        return banks
+
+    def write_rows(self, rows, members=()):
+        """
+        Saves banks and adds game results in one transaction.
+        :param rows: list of (id, bank, hands, wins, losses, pushes, blackjacks, net) tuples, where the game results
+                     are added to the stored totals
+        :param members: iterable of (guild id, user id, net) tuples of users that played in a guild, where net is
+                        added to their net winnings in the guild
+        """
+        with self.conn:
+            self.conn.executemany("INSERT INTO users (id, bank, {}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                                  "ON CONFLICT(id) DO UPDATE SET bank=excluded.bank, {}"
+                                  .format(", ".join(STATS), ", ".join("{0}={0}+excluded.{0}".format(stat) for stat in STATS)),
+                                  rows)
+            self.conn.executemany("INSERT INTO members (guild_id, user_id, net) VALUES (?, ?, ?) "
+                                  "ON CONFLICT(guild_id, user_id) DO UPDATE SET net=net+excluded.net", members)
+            self.conn.executemany("UPDATE members SET bank=? WHERE user_id=?", [(row[1], row[0]) for row in rows])
+
+    def load_stats(self, user_id):
+        """
+        :param user_id: str id of a user
+        :return: dict of the bank and every stat in STATS of the user, or None if the user is not in the database
+        """
+        data = self.conn.execute("SELECT bank, {} FROM users WHERE id=?".format(", ".join(STATS)), (user_id,)).fetchone()
+        return dict(zip(("bank",) + STATS, data)) if data else None
+
+    def leaderboard(self, guild_id, limit, order="bank"):
+        """
+        :param guild_id: str id of the guild
+        :param limit: int number of users to return
+        :param order: 'bank' or 'net', the value users are ranked by
+        :return: list of (user id, bank, net) tuples of the top users of the guild, best first
+        """
+        if order not in ("bank", "net"):
+            raise ValueError("Leaderboards are ordered by bank or net, not " + order)
+        return self.conn.execute("SELECT user_id, bank, net FROM members WHERE guild_id=? ORDER BY {} DESC LIMIT ?"
+                                 .format(order), (guild_id, limit)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class AsyncUserDatabase:
+    """
+    Runs a 'UserDatabase' on a dedicated thread so that no table ever waits on disk.
+
+    Writes go into a write-behind queue holding the latest bank of every user that has not been saved yet. The queue
+    is saved in one transaction every FLUSH_INTERVAL seconds, as soon as it holds FLUSH_SIZE users, and on shutdown.
+    Reads of users in the queue are answered from it, then from a cache of the most recently used banks, and
+    everything else is read on the database thread. Every write also updates the cache, so it never goes stale.
+
+    Parameters:
+        path | str
+            Path of the database file, which is created if it does not exist
+        loop | :class: 'AbstractEventLoop'
+            The event loop the database is used from
+
+    Attributes:
+        FLUSH_INTERVAL | float
+            The number of seconds between saves of the write-behind queue
+        FLUSH_SIZE | int
+            The number of queued users that triggers a save right away
+        CACHE_SIZE | int
+            The number of banks kept in the cache
+        LEADERBOARD_SIZE | int
+            The number of users kept in a cached leaderboard
+        pending | dict of str to list of int
+            The write-behind queue, the latest unsaved bank of every user followed by their unsaved game results
+        pending_members | dict of tuple to int
+            The unsaved net winnings of users in the guilds they played in, keyed by (guild id, user id)
+        leaderboards | dict
+            The top users of every leaderboard asked for since the last save, keyed by guild id and order
+        saves | int
+            The number of saves started or finished, so a leaderboard read while saving is not cached
+        cache | OrderedDict of str to int
+            The banks of recently used users, from least to most recently used. None for users known not to be in
+            the database.
+    """
+
+    FLUSH_INTERVAL = 5.0
+    FLUSH_SIZE = 100
+    CACHE_SIZE = 10000
+    LEADERBOARD_SIZE = 25
+
+    def __init__(self, path, loop):
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="users.db")
+        # the connection is created on the database thread, which every later call runs on
+        self._database = self.executor.submit(UserDatabase, path)
+        self.pending = dict()
+        self.pending_members = dict()
+        self.cache = OrderedDict()
+        self.leaderboards = dict()
+        self.saves = 0
+        self._flusher = tracing.detach(loop, self._flush_periodically())
+
+    async def _run(self, method, *args):
+        def call():
+            return getattr(self._database.result(), method)(*args)
+        with DATABASE_SECONDS.labels(method).time(), tracing.span("database." + method):
+            return await self.loop.run_in_executor(self.executor, call)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                logging.exception("Could not save users, retrying at the next flush")
+
+    async def load_bank(self, user_id):
+        """
+        :param user_id: str id of a user
+        :return: int bank of the user, or None if the user is not in the database
+        """
+        if user_id in self.pending:
+            return self.pending[user_id][0]
+        if user_id in self.cache:
+            self.cache.move_to_end(user_id)
+            return self.cache[user_id]
+        bank = await self._run("load_bank", user_id)
+        self._remember(user_id, bank)
+        return bank
+
+    def _remember(self, user_id, bank):
+        """
+        Caches a bank read from the database, unless a newer bank was written while it was being read.
+        """
+        if user_id not in self.cache:
+            self.cache[user_id] = bank
+            if len(self.cache) > self.CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+    async def load_users(self, users):
+        """
+        Loads the banks of many users at once. Users that are not cached are looked up together in one query.
+        :param users: iterable of 'User' objects to update the bank value of
+        """
+        users = list(users)
+        misses = [_user.id for _user in users if _user.id not in self.pending and _user.id not in self.cache]
+        if misses:
+            banks = await self._run("load_banks", misses)
+            for user_id in misses:
+                self._remember(user_id, banks.get(user_id))
+        for _user in users:
+            bank = self.pending[_user.id][0] if _user.id in self.pending else self.cache.get(_user.id)
+            if _user.id in self.cache:
+                self.cache.move_to_end(_user.id)
+            if bank is not None:
+                _user.set_bank(bank)
+
+    async def load_user(self, _user):
+        """
+        If the user is in the database, loads the bank value from the database as the user's current bank
+        :param _user: 'User' class object to update bank value of
+        """
+        bank = await self.load_bank(_user.id)
+        if bank is not None:
+            _user.set_bank(bank)
+
+    def _queue(self, user_id, bank, stats):
+        row = self.pending.get(user_id)
+        if row is None:
+            self.pending[user_id] = [bank] + list(stats)
+        else:
+            row[0] = bank
+            for i, value in enumerate(stats, 1):
+                row[i] += value
+
+    def write_users(self, users, guild_id=None):
+        """
+        Queues the current bank and the unsaved game results of every user to be saved. This never waits on the
+        database.
+        :param users: iterable of 'User' objects to save
+        :param guild_id: str id of the guild the users played in, or None
+        """
+        for _user in users:
+            stats = _user.take_stats()
+            self._queue(_user.id, _user.bank, stats)
+            if guild_id is not None:
+                key = (guild_id, _user.id)
+                self.pending_members[key] = self.pending_members.get(key, 0) + stats[-1]
+            self.cache[_user.id] = _user.bank
+            self.cache.move_to_end(_user.id)
+        while len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+        if len(self.pending) >= self.FLUSH_SIZE:
+            tracing.detach(self.loop, self.flush())
+
+    async def flush(self):
+        """
+        Saves every queued bank and game result in one transaction.
+        """
+        if not self.pending and not self.pending_members:
+            return
+        rows, self.pending = self.pending, dict()
+        members, self.pending_members = self.pending_members, dict()
+        self._saved()
+        try:
+            await self._run("write_rows", [(user_id,) + tuple(row) for user_id, row in rows.items()],
+                            [key + (net,) for key, net in members.items()])
+        except sqlite3.Error:
+            for user_id, row in rows.items(): # banks queued again while saving are newer, game results add up
+                bank = self.pending[user_id][0] if user_id in self.pending else row[0]
+                self._queue(user_id, bank, row[1:])
+            for key, net in members.items():
+                self.pending_members[key] = self.pending_members.get(key, 0) + net
+            raise
+        finally:
+            self._saved()
+
+    def _saved(self):
+        """
+        Drops the cached leaderboards when a save starts or ends, along with any being read at that moment.
+        """
+        self.saves += 1
+        self.leaderboards.clear()
+
+    async def load_stats(self, user_id):
+        """
+        :param user_id: str id of a user
+        :return: dict of the bank and every stat in STATS of the user, including results that are not saved yet,
+                 or None if the user never played
+        """
+        stats = await self._run("load_stats", user_id)
+        row = self.pending.get(user_id)
+        if row is not None:
+            stats = stats or dict.fromkeys(("bank",) + STATS, 0)
+            stats["bank"] = row[0]
+            for stat, value in zip(STATS, row[1:]):
+                stats[stat] += value
+        return stats
+
+    async def leaderboard(self, guild_id, limit, order="bank"):
+        """
+        Reads the top users of a guild from the database once, then from a cache until the next save.
+        :param guild_id: str id of the guild
+        :param limit: int number of users to return, at most LEADERBOARD_SIZE
+        :param order: 'bank' or 'net', the value users are ranked by
+        :return: list of (user id, bank, net) tuples of the top users of the guild, best first
+        """
+        key = (guild_id, order)
+        leaderboard = self.leaderboards.get(key)
+        if leaderboard is None:
+            saves = self.saves
+            leaderboard = await self._run("leaderboard", guild_id, self.LEADERBOARD_SIZE, order)
+            if saves == self.saves:
+                self.leaderboards[key] = leaderboard
+        return leaderboard[:limit]
+
+    async def shutdown(self):
+        """
+        Saves everything left in the queue and closes the database.
+        """
+        self._flusher.cancel()
+        await self.flush()
+        await self._run("close")
+        self.executor.shutdown(wait=True)
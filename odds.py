@@ -0,0 +1,154 @@
+"""
+Project Name: blackjack-bot
+File Name: odds.py
+
+Description: Exact probabilities of the dealer's final hand for a given visible card and shoe composition.
+"""
+
+
+from functools import lru_cache
+import card
+
+# final results of the dealer's hand, in the order of the probabilities returned by this module
+OUTCOMES = (17, 18, 19, 20, 21, "bust")
+BUST = len(OUTCOMES) - 1
+
+CACHE_SIZE = 1 << 17
+
+# composition of a single 52 card deck, the number of cards of every value from 1 (Ace) to 10
+FULL_DECK = tuple(sum(1 for c in card.Card.DECK if c.value == value) for value in range(1, 11))
+
+
+def composition(cards):
+    """
+    Counts the cards of every value.
+    :param cards: iterable of Card objects
+    :return: tuple of the number of cards of every value from 1 (Ace) to 10
+    """
+    counts = [0] * 10
+    for c in cards:
+        counts[c.value - 1] += 1
+    return tuple(counts)
+
+
+def shoe_composition(shoe):
+    """
+    :param shoe: 'Shoe' to count the cards of
+    :return: composition of the cards that have not been drawn from the shoe yet
+    """
+    counts = [0] * 10
+    values = [c.value - 1 for c in card.Card.DECK]
+    for code in shoe.codes[shoe.position:]:
+        counts[values[code]] += 1
+    return tuple(counts)
+
+
+def remove(counts, cards):
+    """
+    :param counts: composition to remove cards from
+    :param cards: iterable of Card objects to remove
+    :return: new composition without the cards
+    """
+    counts = list(counts)
+    for c in cards:
+        counts[c.value - 1] -= 1
+    return tuple(counts)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _dealer_final(hand_value, has_ace, counts):
+    """
+    Probability of every final result of a dealer's hand that keeps hitting under the rule of
+    :meth: 'Dealer.hit_until_hold'. Hands are described like in :class: 'Player': the total of the cards that are not
+    an Ace and whether there is an Ace, since only one Ace counts.
+    :param hand_value: int total of the cards in the hand that are not an Ace
+    :param has_ace: bool stating if there is an Ace in the hand
+    :param counts: composition of the cards left to draw from
+    :return: tuple of the probability of every result in OUTCOMES
+    """
+    low_value = hand_value + 1 if has_ace else hand_value
+    if low_value >= 17:
+        result = [0.0] * len(OUTCOMES)
+        result[BUST if low_value > 21 else low_value - 17] = 1.0
+        return tuple(result)
+    total = sum(counts)
+    if total == 0: # the shoe is shuffled when it runs out, which is assumed to bring back a full deck
+        counts, total = FULL_DECK, sum(FULL_DECK)
+    result = [0.0] * len(OUTCOMES)
+    for i, count in enumerate(counts):
+        if count:
+            value = i + 1
+            drawn = counts[:i] + (count - 1,) + counts[i + 1:]
+            if value == 1:
+                after = _dealer_final(hand_value, True, drawn)
+            else:
+                after = _dealer_final(hand_value + value, has_ace, drawn)
+            chance = count / total
+            for j, p in enumerate(after):
+                result[j] += chance * p
+    return tuple(result)
+
+
+def dealer_distribution(upcard, counts):
+    """
+    Exact probability of every final result of the dealer's hand, given the card the dealer shows and the cards left
+    in the shoe. The dealer's second card is drawn from those cards as well.
+    :param upcard: the dealer's visible Card, or its int value
+    :param counts: composition of the cards that the dealer's other cards are drawn from
+    :return: tuple of the probability of every result in OUTCOMES
+    """
+    value = upcard if isinstance(upcard, int) else upcard.value
+    if value == 1:
+        return _dealer_final(0, True, tuple(counts))
+    return _dealer_final(value, False, tuple(counts))
+
+
+def dealer_outcomes(counts):
+    """
+    Exact probability of every final result of the dealer's hand before any card has been drawn.
+    :param counts: composition of the cards left in the shoe
+    :return: tuple of the probability of every result in OUTCOMES
+    """
+    counts = tuple(counts)
+    return _dealer_final(0, False, counts)
+
+
+def cache_info():
+    """
+    :return: hit and miss statistics of the cache of dealer results
+    """
+    return _dealer_final.cache_info()
+
+
+def clear_cache():
+    _dealer_final.cache_clear()
+
+
+def test():
+    import time
+    import dealer as _dealer
+    import shoe as _shoe
+    counts = tuple(count * 6 for count in FULL_DECK)
+    start = time.perf_counter()
+    exact = dealer_outcomes(counts)
+    print("six decks computed in {:.3f}s".format(time.perf_counter() - start))
+    start = time.perf_counter()
+    dealer_outcomes(counts)
+    print("six decks cached in {:.6f}s".format(time.perf_counter() - start))
+
+    games = 200000
+    shoe = _shoe.Shoe(decks=6, penetration=0)
+    dealer = _dealer.Dealer(None)
+    sampled = [0] * len(OUTCOMES)
+    for _ in range(games):
+        shoe.shuffle()
+        dealer.deal(shoe)
+        dealer.hit_until_hold()
+        sampled[BUST if dealer.is_bust() else dealer.low_value - 17] += 1
+        dealer.reset()
+    for outcome, p, n in zip(OUTCOMES, exact, sampled):
+        print("{:>5} exact {:.4f} sampled {:.4f}".format(outcome, p, n / games))
+
+
+if __name__ == "__main__":
+    test()
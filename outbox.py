@@ -0,0 +1,276 @@
+"""
+Project Name: blackjack-bot
+File Name: outbox.py
+
+Description: Sends and edits messages within Discord's rate limits, coalescing updates to messages that keep growing.
+"""
+
+
+import asyncio
+import logging
+import metrics
+import time
+import tracing
+import discord
+
+MESSAGE_LIMIT = 2000
+
+REQUESTS = metrics.registry.counter("blackjack_discord_requests_total", "Requests to Discord, by method and result",
+                                    ("method", "result"))
+REQUEST_SECONDS = metrics.registry.histogram("blackjack_discord_request_seconds", "Seconds a request to Discord took, "
+                                             "not counting waiting for the rate limits", ("method",))
+
+class TokenBucket:
+    """
+    Rate limiter that allows bursts of up to capacity requests and rate requests per second after that.
+
+    Parameters:
+        rate | float
+            The number of tokens added every second
+        capacity | int
+            The largest number of tokens the bucket holds
+        loop | :class: 'AbstractEventLoop'
+            The event loop whose clock is used
+
+    Attributes:
+        EPSILON | float
+            Shortfall of a whole token that is still taken as one, as refilling can fall short by a rounding error
+        MIN_WAIT | float
+            The shortest number of seconds waited for a token, so the clock always moves before trying again
+    """
+
+    EPSILON = 1e-9
+    MIN_WAIT = 0.001
+
+    def __init__(self, rate, capacity, loop):
+        self.rate = rate
+        self.capacity = capacity
+        self.loop = loop
+        self.tokens = capacity
+        self.updated = loop.time()
+
+    async def acquire(self):
+        """
+        Takes a token from the bucket, waiting until one is available.
+        """
+        while True:
+            now = self.loop.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1 - self.EPSILON:
+                self.tokens = max(0.0, self.tokens - 1)
+                return
+            await asyncio.sleep(max((1 - self.tokens) / self.rate, self.MIN_WAIT))
+
+
+def split_content(content, limit=MESSAGE_LIMIT):
+    """
+    Splits a message into parts that fit in a Discord message, breaking at new lines where possible.
+    :param content: str to split
+    :param limit: int largest number of characters of a part
+    :return: list of str parts
+    """
+    parts = list()
+    while len(content) > limit:
+        cut = content.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(content[:cut])
+        content = content[cut:].lstrip("\n")
+    parts.append(content)
+    return parts
+
+
+class LiveMessage:
+    """
+    Represents a message that keeps growing as lines are appended to it, like the list of players that joined or bet.
+
+    Appending only schedules an update; every line appended within COALESCE_WINDOW seconds goes out in one send or
+    edit. Once the message grows past the 2000 character limit of Discord, the overflow continues in a new message.
+
+    Parameters:
+        outbox | :class: 'Outbox'
+            The outbox that sends and edits the message
+        channel | :class: 'Channel'
+            The channel the message is sent in
+        content | str
+            The first line of the message
+
+    Attributes:
+        parts | list of str
+            Every line of the message, joined with blank lines
+        messages | list of :class: 'Message'
+            The Discord messages holding the content, one per 2000 characters
+    """
+
+    def __init__(self, outbox, channel, content=""):
+        self.outbox = outbox
+        self.channel = channel
+        self.parts = [content] if content else list()
+        self.messages = list()
+        self._sent = list()
+        self._lock = asyncio.Lock()
+        self._scheduled = None
+
+    @property
+    def content(self):
+        return "\n\n".join(self.parts)
+
+    def append(self, text):
+        """
+        Adds a line to the message and schedules an update.
+        :param text: str to add
+        """
+        self.parts.append(text)
+        if self._scheduled is None:
+            self._scheduled = tracing.detach(self.outbox.loop, self._flush_later(), table=self.channel.id)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.outbox.COALESCE_WINDOW)
+        self._scheduled = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Sends or edits the Discord messages whose part of the content changed since the last update. Content that
+        could not be sent is sent by the next update.
+        """
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        async with self._lock:
+            for i, chunk in enumerate(split_content(self.content)):
+                if i < len(self.messages):
+                    if self._sent[i] != chunk:
+                        edited = await self.outbox.edit(self.messages[i], chunk)
+                        if edited is not None: # otherwise the next update edits it again
+                            self.messages[i] = edited
+                            self._sent[i] = chunk
+                elif chunk:
+                    message = await self.outbox.send(self.channel, chunk)
+                    if message is None: # left unsent, the next update tries again
+                        break
+                    self.messages.append(message)
+                    self._sent.append(chunk)
+
+
+class Outbox:
+    """
+    Sends and edits messages for the client through token buckets that match Discord's rate limits, retrying requests
+    that are rate limited and edits that come back empty. A request that fails for good is logged and returns None, so a failing
+    request never ends a session.
+
+    Parameters:
+        client | :class: 'Client'
+            The discord.py client used to send and edit messages
+
+    Attributes:
+        GLOBAL_RATE | float
+            The number of requests per second allowed across all channels
+        CHANNEL_RATE | float
+            The number of messages per second allowed in a single channel
+        CHANNEL_BURST | int
+            The number of messages that may be sent at once in a single channel
+        COALESCE_WINDOW | float
+            The number of seconds updates to a :class: 'LiveMessage' are collected before they are sent
+        RETRIES | int
+            The number of times a request is retried
+    """
+
+    GLOBAL_RATE = 50
+    CHANNEL_RATE = 1
+    CHANNEL_BURST = 5
+    COALESCE_WINDOW = 0.5
+    RETRIES = 5
+
+    def __init__(self, client):
+        self.client = client
+        self.loop = client.loop
+        self.global_bucket = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_RATE, self.loop)
+        self.channel_buckets = dict()
+
+    def live(self, channel, content=""):
+        """
+        :return: new 'LiveMessage' in the channel
+        """
+        return LiveMessage(self, channel, content)
+
+    def forget(self, channel):
+        """
+        Drops the rate limit state of a channel that is no longer used.
+        """
+        self.channel_buckets.pop(channel.id, None)
+
+    async def _request(self, channel, request, *args, idempotent=True):
+        """
+        Makes a request to Discord within the rate limits, retrying it after a 429. A request that comes back empty is
+        retried with a backoff only if it is idempotent, as an empty answer does not tell whether it went through.
+        :param channel: 'Channel' the request is made in
+        :param request: coroutine function of the client making the request
+        :param args: arguments passed to request
+        :param idempotent: bool, False for requests such as sending a message that must not be made twice
+        :return: the result of the request, or None if it failed
+        """
+        bucket = self.channel_buckets.get(channel.id)
+        if bucket is None:
+            bucket = self.channel_buckets[channel.id] = TokenBucket(self.CHANNEL_RATE, self.CHANNEL_BURST, self.loop)
+        for attempt in range(self.RETRIES):
+            with tracing.span("rate_limit_wait"):
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+            start = time.perf_counter()
+            try:
+                with tracing.span(request.__name__, channel=channel.id):
+                    result = await request(*args)
+            except discord.HTTPException as e:
+                REQUEST_SECONDS.labels(request.__name__).observe(time.perf_counter() - start)
+                status = getattr(e.response, "status", None)
+                if status != 429:
+                    REQUESTS.labels(request.__name__, "error").inc()
+                    logging.error("Request in channel %s failed with status %s: %s", channel.id, status, e)
+                    return None
+                REQUESTS.labels(request.__name__, "rate_limited").inc()
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                logging.warning("Rate limited in channel %s, retrying in %s seconds", channel.id, retry_after)
+                with tracing.span("rate_limit_retry", retry_after=retry_after):
+                    await asyncio.sleep(retry_after)
+                continue
+            REQUEST_SECONDS.labels(request.__name__).observe(time.perf_counter() - start)
+            if result is not None:
+                REQUESTS.labels(request.__name__, "ok").inc()
+                return result
+            REQUESTS.labels(request.__name__, "none").inc()
+            if not idempotent:
+                logging.error("Gave up on a request in channel %s that came back empty, it may have gone through",
+                              channel.id)
+                return None
+            await asyncio.sleep(2 ** attempt * 0.25)
+        logging.error("Gave up on a request in channel %s after %s attempts", channel.id, self.RETRIES)
+        return None
+
+    async def send(self, channel, content):
+        """
+        Sends a message, splitting it into several messages if it is longer than 2000 characters.
+        :param channel: 'Channel' to send the message in
+        :param content: str content of the message
+        :return: the last 'Message' sent, or None if it could not be sent
+        """
+        message = None
+        for chunk in split_content(content):
+            message = await self._request(channel, self.client.send_message, channel, chunk, idempotent=False)
+        return message
+
+    async def edit(self, message, content):
+        """
+        Edits a message. Content beyond 2000 characters is sent as new messages.
+        :param message: 'Message' to edit, nothing is edited if it is None
+        :param content: str new content of the message
+        :return: the edited 'Message', or None if it could not be edited
+        """
+        if message is None:
+            return None
+        chunks = split_content(content)
+        edited = await self._request(message.channel, self.client.edit_message, message, chunks[0])
+        for chunk in chunks[1:]:
+            await self._request(message.channel, self.client.send_message, message.channel, chunk, idempotent=False)
+        return edited
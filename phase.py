@@ -0,0 +1,42 @@
+"""
+Project Name: blackjack-bot
+File Name: phase.py
+
+Description: Timed phases of a game with a single deadline on the event loop's clock.
+"""
+
+
+import asyncio
+
+class Phase:
+    """
+    Represents a timed phase of a game (intermission, betting or a round) with a single deadline on the event loop's
+    monotonic clock. Waiting for commands during the phase only ever waits for the time that is left, so the phase
+    ends at its deadline no matter how many commands arrive.
+
+    Parameters:
+        duration | float
+            The number of seconds the phase lasts
+        loop | :class: 'AbstractEventLoop'
+            The event loop whose clock is used, the current event loop if None
+
+    Attributes:
+        deadline | float
+            The time of the loop's clock at which the phase ends
+    """
+
+    def __init__(self, duration, loop=None):
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.deadline = self.loop.time() + duration
+
+    def remaining(self):
+        """
+        :return: float number of seconds until the deadline, 0 if it has passed
+        """
+        return max(0.0, self.deadline - self.loop.time())
+
+    def is_over(self):
+        """
+        :return: True if the deadline has passed, False otherwise
+        """
+        return self.remaining() == 0.0
@@ -28,8 +28,6 @@ The MIT License (MIT)
 Copyright (c) 2016 Connor York
 """
 
-import card
-
 class Player:
     """
     Represents a player in Blackjack, which can be a dealer or a human player.
@@ -49,6 +47,18 @@ class Player:
         has_played | bool
             States if the player has currently played in the round (Has not hit or held)
             This will always be True if the player is not eligible to play more rounds (busted or held hand)
+        shoe | :class: 'Shoe'
+            The shoe of the table the player was last dealt from, which is also used for hitting
+        hand_value | int
+            Running total of the values of the cards in the hand that are not an Ace
+        has_ace | bool
+            States if there is an Ace in the hand. Only one Ace is counted, as either 1 or 11.
+        card_count | int
+            Number of cards in the hand
+        low_value | int
+            The lowest value of the hand, counting the Ace as 1
+        best_value | int
+            The largest value of the hand that is 21 or below, or low_value if every value is above 21
     """
 
 
@@ -58,14 +68,39 @@ class Player:
         self.is_playing = True
         self.has_played = False
         self.is_busted = False
+        self.shoe = None
+        self.hand_value = 0
+        self.has_ace = False
+        self.card_count = 0
+        self.low_value = 0
+        self.best_value = 0
 
-    def deal(self):
+    def deal(self, shoe):
         """
-        Assigns an initial hand of two random cards to the player.
+        Assigns an initial hand of two cards drawn from the shoe to the player.
+        :param shoe: 'Shoe' of the table the player is sitting at
         """
+        self.shoe = shoe
         self.is_playing = True
-        for _ in range(2):
-            self.hand.append(card.Card.draw_card())
+        self.add_card(shoe.draw())
+        self.add_card(shoe.draw())
+
+    def add_card(self, c):
+        """
+        Adds a card to the hand and updates the values of the hand in constant time.
+        :param c: 'Card' to add
+        """
+        self.hand.append(c)
+        self.card_count += 1
+        if c.value == 1:
+            self.has_ace = True
+        else:
+            self.hand_value += c.value
+        if self.has_ace:
+            self.low_value = self.hand_value + 1
+            self.best_value = self.low_value + 10 if self.low_value <= 11 else self.low_value
+        else:
+            self.low_value = self.best_value = self.hand_value
 
     def hand_str(self, num_cards=None):
         """
@@ -81,11 +116,22 @@ class Player:
         return hand_string
 
 
+    def hand_codes(self):
+        """
+        :return: bytes of the codes of the cards in the player's hand
+        """
+        return bytes(c.code for c in self.hand)
+
     def reset_hand(self):
         """
         Resets the players hand to an empty hand of no cards
         """
         self.hand.clear()
+        self.hand_value = 0
+        self.has_ace = False
+        self.card_count = 0
+        self.low_value = 0
+        self.best_value = 0
 
     def reset(self):
         """
@@ -102,7 +148,7 @@ class Player:
         :return: True if successful hit, False if not
         """
         if self.is_playing and not self.has_played and not self.is_bust():
-            self.hand.append(card.Card.draw_card())
+            self.add_card(self.shoe.draw())
             self.has_played = True
             return True
         return False
@@ -124,21 +170,9 @@ class Player:
         This is useful when a player has an Ace in their hand, as it can be of value 1 or 11.
         :return: list of possible integer values of the players current hand
         """
-        values = list()
-        has_ace = False
-        hand_value = 0
-        for c in self.hand:
-            if isinstance(c, card.Card):
-                if c.value is 1:
-                    has_ace = True
-                else:
-                    hand_value += c.value
-        if has_ace:  # append the current hand value with the two values of an Ace
-            values.append(hand_value + 1)
-            values.append(hand_value + 11)
-        else:
-            values.append(hand_value)
-        return values
+        if self.has_ace:  # the current hand value with the two values of an Ace
+            return [self.hand_value + 1, self.hand_value + 11]
+        return [self.hand_value]
 
     def is_bust(self):
         """
@@ -146,20 +180,14 @@ class Player:
         If the hand has multiple values, both must be a value over 21 in order to be considered busted.
         :return: Boolean stating if busted
         """
-        for value in self.get_hand_values():
-            if value <= 21:
-                return False
-        return True
+        return self.low_value > 21
 
     def has_blackjack(self):
         """
         Determines if the player has blackjack, a hand of value 21.
         :return: Boolean stating if the player has 21
         """
-        for value in self.get_hand_values():
-            if value is 21:
-                return True
-        return False
+        return self.best_value == 21
 
     def bust(self):
         """
@@ -0,0 +1,222 @@
+"""
+Project Name: blackjack-bot
+File Name: profiling.py
+
+Description: Profiles sessions or games on demand with cProfile, a stack sampler and tracemalloc.
+"""
+
+import cProfile
+import collections
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+TARGETS = ("session", "game")
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval from a background thread, counting every distinct stack.
+    Coroutines that are running show up on the stack of the event loop's thread, so the samples show which table code
+    the loop was busy with.
+
+    Parameters:
+        thread_id | int
+            The id of the thread to sample
+        interval | float
+            The number of seconds between samples
+
+    Attributes:
+        stacks | Counter of str
+            The number of samples of every stack, in collapsed format: frames from the outermost call, separated by ';'
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="stack sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = list()
+            while frame is not None:
+                code = frame.f_code
+                frames.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def collapsed(self):
+        """
+        :return: str of every stack and its number of samples, one per line, as read by flame graph tools
+        """
+        return "".join("{} {}\n".format(stack, count) for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """
+    Profiles a chosen number of sessions or games with cProfile, a stack sampler and tracemalloc, writing the results
+    to timestamped files. It is off until armed, from the command line or with the '$profile' admin command, and
+    turns itself off again after the chosen number of runs.
+
+    Only one run is profiled at a time and only every 'every'-th run is profiled, which keeps the overhead bounded.
+    The profile covers everything the event loop does while the run is in progress, including other tables.
+
+    For every profiled run, four files named after the time, target and table are written:
+        .pstats      cProfile statistics, for pstats or snakeviz
+        .txt         the functions with the most cumulative time
+        .folded      collapsed stacks of the stack sampler, for flame graphs
+        -alloc.txt   the lines that allocated the most memory still in use at the end of the run
+
+    Parameters:
+        directory | str
+            The directory the profiles are written to, created when the first profile is written
+        interval | float
+            The number of seconds between samples of the stack sampler
+        top | int
+            The number of functions and allocation sites written to the text reports
+
+    Attributes:
+        target | str
+            'session' or 'game', the runs to profile, or None if the profiler is off
+        remaining | int
+            The number of runs still to profile, counting down as every run starts
+        every | int
+            Only one of this many runs is profiled
+        active | bool
+            True while a run is being profiled
+        profiled | int
+            The number of runs profiled so far, which numbers the files
+    """
+
+    def __init__(self, directory="profiles", interval=0.005, top=30):
+        self.directory = directory
+        self.interval = interval
+        self.top = top
+        self.target = None
+        self.remaining = 0
+        self.every = 1
+        self.active = False
+        self.profiled = 0
+        self._skipped = 0
+
+    def arm(self, count, target="game", every=1):
+        """
+        Profiles the next runs of a target.
+        :param count: int number of runs to profile, 0 turns the profiler off
+        :param target: 'session' or 'game'
+        :param every: int, only one of this many runs is profiled
+        """
+        if target not in TARGETS:
+            raise ValueError("Can only profile a session or a game, not " + target)
+        self.target = target if count > 0 else None
+        self.remaining = count
+        self.every = max(1, every)
+        self._skipped = 0
+
+    def profile(self, target, table_id):
+        """
+        :param target: 'session' or 'game', the run that is starting
+        :param table_id: str id of the channel of the table
+        :return: context manager that profiles the run inside it if the profiler is armed for it, spanning awaits
+        """
+        if self.target != target or self.active:
+            return _NOT_PROFILING
+        self._skipped += 1
+        if self._skipped < self.every:
+            return _NOT_PROFILING
+        self._skipped = 0
+        self.profiled += 1
+        # counted before the run starts, so a run that can not be profiled still counts down
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.target = None
+        return _Run(self, target, table_id)
+
+    def _finished(self, name, profile, sampler, snapshot):
+        # writing the reports takes a while, so it is done off the event loop
+        threading.Thread(target=self._write, args=(name, profile, sampler, snapshot), daemon=True).start()
+
+    def _write(self, name, profile, sampler, snapshot):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, name)
+            profile.dump_stats(path + ".pstats")
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(self.top)
+            with open(path + ".txt", "w") as f:
+                f.write(report.getvalue())
+            with open(path + ".folded", "w") as f:
+                f.write(sampler.collapsed())
+            if snapshot is not None:
+                with open(path + "-alloc.txt", "w") as f:
+                    for stat in snapshot.statistics("lineno")[:self.top]:
+                        f.write("{}\n".format(stat))
+            logging.info("Wrote profile %s", path)
+        except OSError:
+            logging.exception("Could not write profile %s", name)
+
+
+class _Run:
+    """
+    Profiles one run while it is entered.
+    """
+
+    def __init__(self, profiler, target, table_id):
+        self.profiler = profiler
+        self.name = "{}-{:03d}-{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), profiler.profiled, target, table_id)
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), profiler.interval)
+        self.traced = False
+
+    def __enter__(self):
+        try:
+            self.profile.enable()
+        except ValueError: # another profiler is running in this process
+            logging.warning("Could not profile %s, another profiler is active", self.name)
+            self.profile = None
+            return self
+        self.profiler.active = True
+        self.traced = not tracemalloc.is_tracing()
+        if self.traced:
+            tracemalloc.start()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.sampler.stop()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self.traced:
+            tracemalloc.stop()
+        self.profiler.active = False
+        self.profiler._finished(self.name, self.profile, self.sampler, snapshot)
+
+
+class _NotProfiling:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOT_PROFILING = _NotProfiling()
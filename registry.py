@@ -0,0 +1,96 @@
+"""
+Project Name: blackjack-bot
+File Name: registry.py
+
+Description: The players of a table, indexed by member id, with counts of how many are in every state of a game.
+"""
+
+
+class PlayerRegistry:
+    """
+    Holds the players of a table, indexed by member id, and keeps count of how many players are in every state of a
+    game, so checking whether a phase is complete takes constant time no matter how many players are at the table.
+
+    Players keep their state in plain attributes and know nothing of the registry, so the table makes every change
+    to a player at the table through update, or calls recount after changing every player at once.
+
+    Attributes:
+        not_bet | int
+            The number of players that have not bet in the current game
+        not_played | int
+            The number of players that have not hit or held in the current round
+        playing | int
+            The number of players that are still eligible to play in the game (not holding or busted)
+    """
+
+    def __init__(self):
+        self._players = dict()
+        self.not_bet = 0
+        self.not_played = 0
+        self.playing = 0
+
+    def __iter__(self):
+        return iter(list(self._players.values()))
+
+    def __len__(self):
+        return len(self._players)
+
+    def __contains__(self, player):
+        return self._players.get(player.id) is player
+
+    def get(self, member_id):
+        """
+        :param member_id: str id of a member
+        :return: 'User' of the member, or None if they are not at the table
+        """
+        return self._players.get(member_id)
+
+    def add(self, player):
+        """
+        Adds a player to the table and starts counting their state.
+        :param player: 'User' to add
+        """
+        self._players[player.id] = player
+        self._count(player, 1)
+
+    def remove(self, player):
+        """
+        Removes a player from the table.
+        :param player: 'User' to remove
+        """
+        del self._players[player.id]
+        self._count(player, -1)
+
+    def clear(self):
+        for player in self:
+            self.remove(player)
+
+    def _count(self, player, sign):
+        if player.current_bet == 0:
+            self.not_bet += sign
+        if not player.has_played:
+            self.not_played += sign
+        if player.is_playing:
+            self.playing += sign
+
+    def update(self, player, change, *args):
+        """
+        Changes the state of one player at the table and updates the counts in constant time.
+        :param player: 'User' at the table
+        :param change: callable that changes the state of the player, e.g. player.hit
+        :param args: arguments passed to change
+        :return: what change returned
+        """
+        self._count(player, -1)
+        try:
+            return change(*args)
+        finally:
+            self._count(player, 1)
+
+    def recount(self):
+        """
+        Counts the state of every player again, after the table changed all of them at once.
+        """
+        self.not_bet = self.not_played = self.playing = 0
+        for player in self._players.values():
+            self._count(player, 1)
@@ -0,0 +1,184 @@
+"""
+Project Name: blackjack-bot
+File Name: replay.py
+
+Description: Replays recorded games from the hand history through the bot's game code and reports any mismatch.
+"""
+
+import collections
+import dealer as _dealer
+import engine
+import history as _history
+import shoe as _shoe
+import sys
+import user
+
+# decks and penetration of the shoes of tables, see :class: 'Table'
+SHOE_DECKS = 6
+SHOE_PENETRATION = 0.75
+
+Replay = collections.namedtuple("Replay", "table session game payouts mismatches")
+Replay.__doc__ = """
+The result of replaying a game. 'payouts' maps the id of every player to the memes they won (positive) or lost
+(negative) in the replay, and 'mismatches' lists the differences from the recorded history, which is empty if the game
+was reproduced exactly.
+"""
+
+
+class ReplayMember:
+    """
+    Stands in for the discord.py Member of a recorded player.
+    """
+
+    def __init__(self, member_id):
+        self.id = member_id
+        self.nick = None
+
+
+def group_games(events):
+    """
+    Groups a stream of events into games.
+    :param events: iterable of 'Event' ordered as recorded, e.g. from history.read_history
+    :return: generator of lists of the events of one game of one table, yielded once the game is complete
+    """
+    games = dict()
+    for event in events:
+        game = games.get(event.table)
+        if event.kind == _history.GAME:
+            if game is not None:
+                yield game
+            games[event.table] = [event]
+        elif game is not None and (game[0].session, game[0].game) == (event.session, event.game):
+            game.append(event)
+            if event.kind == _history.SETTLE and _is_settled(game):
+                yield games.pop(event.table)
+    for game in games.values(): # games cut off by the end of the history
+        yield game
+
+
+def _is_settled(game):
+    dealt = sum(1 for event in game if event.kind == _history.DEAL and event.player)
+    settled = sum(1 for event in game if event.kind == _history.SETTLE)
+    return dealt == settled
+
+
+def replay_game(events, decks=SHOE_DECKS, penetration=SHOE_PENETRATION):
+    """
+    Plays a recorded game again with the same Shoe, Player, Dealer and settlement code as the table, and compares
+    every card and payout with the recording.
+    :param events: list of the 'Event' of one game, starting with its GAME event
+    :param decks: int number of decks of the table's shoe
+    :param penetration: float penetration of the table's shoe
+    :return: 'Replay'
+    """
+    start = events[0]
+    mismatches = list()
+    shoe = _shoe.Shoe(decks, penetration, seed=0)
+    dealer = _dealer.Dealer(ReplayMember(""))
+    players = collections.OrderedDict()
+    restored = False
+    recorded_seeds = list()
+    replayed_seeds = list()
+    shoe.on_shuffle = lambda shuffled: replayed_seeds.append(shuffled.seed)
+    draws = 0
+    payouts = dict()
+
+    def expect(description, recorded, replayed):
+        if recorded != replayed:
+            mismatches.append("{}: recorded {!r}, replayed {!r}".format(description, recorded, replayed))
+
+    def get_player(player_id):
+        if player_id not in players:
+            players[player_id] = user.User(ReplayMember(player_id))
+        return players[player_id]
+
+    for event in events[1:]:
+        if event.kind == _history.SEED:
+            if not restored:
+                shoe.restore(event.value, start.value)
+                restored = True
+            else:
+                recorded_seeds.append(event.value)
+        elif event.kind in (_history.BET, _history.FORCE_BET):
+            get_player(event.player).current_bet = event.value
+        elif event.kind == _history.DEAL:
+            if not event.player:
+                if shoe.needs_shuffle(): # the table shuffles at the cut card before dealing
+                    shoe.shuffle()
+                dealer.deal(shoe)
+                expect("dealer's hand", event.cards, dealer.hand_codes())
+            else:
+                player = get_player(event.player)
+                player.deal(shoe)
+                expect("hand of " + event.player, event.cards, player.hand_codes())
+        elif event.kind == _history.HIT:
+            player = get_player(event.player)
+            player.has_played = False # rounds are not recorded, every recorded hit was allowed
+            player.hit()
+            expect("hit of " + event.player, event.cards, player.hand_codes()[-1:])
+        elif event.kind in (_history.HOLD, _history.FORCE_HOLD):
+            player = get_player(event.player)
+            player.has_played = False
+            player.hold()
+        elif event.kind == _history.BUST:
+            player = get_player(event.player)
+            expect("bust of " + event.player, True, player.is_bust())
+            player.bust()
+        elif event.kind == _history.DEALER_DRAW:
+            if dealer.card_count == 2:
+                dealer.hit_until_hold()
+            expect("dealer draw", event.cards, dealer.hand_codes()[2 + draws:3 + draws])
+            draws += 1
+        elif event.kind == _history.SETTLE:
+            if not payouts:
+                if dealer.card_count == 2:
+                    dealer.hit_until_hold()
+                expect("number of dealer draws", sum(1 for e in events if e.kind == _history.DEALER_DRAW),
+                       dealer.card_count - 2)
+                for player, result, amount in engine.settle_game(dealer, players.values())[1]:
+                    payouts[player.id] = amount if result == engine.WON else -amount if result == engine.LOST else 0
+            expect("payout of " + event.player, event.value, payouts.get(event.player))
+    expect("shuffle seeds", recorded_seeds, replayed_seeds)
+    return Replay(start.table, start.session, start.game, payouts, mismatches)
+
+
+def replay_history(directory, table=None, decks=SHOE_DECKS, penetration=SHOE_PENETRATION):
+    """
+    Replays every complete game of a history directory, streaming it one game at a time.
+    :param directory: str directory of a 'HistoryWriter'
+    :param table: str id of a table to only replay its games, or None for every table
+    :return: generator of 'Replay'
+    """
+    for events in group_games(_history.read_history(directory, table)):
+        if any(event.kind == _history.SEED for event in events):
+            yield replay_game(events, decks, penetration)
+
+
+def main(args):
+    """
+    Usage: python replay.py [history directory] [table id] [session id] [game number]
+    """
+    directory = args[0] if args else "history"
+    table = args[1] if len(args) > 1 else None
+    session = int(args[2]) if len(args) > 2 else None
+    game = int(args[3]) if len(args) > 3 else None
+    games = failed = 0
+    for replay in replay_history(directory, table):
+        if session is not None and replay.session != session or game is not None and replay.game != game:
+            continue
+        games += 1
+        if replay.mismatches:
+            failed += 1
+            print("table {} session {} game {} does not match its history:".format(replay.table, replay.session,
+                                                                                     replay.game))
+            for mismatch in replay.mismatches:
+                print("    " + mismatch)
+        elif game is not None:
+            print("table {} session {} game {} matches its history, payouts: {}".format(replay.table, replay.session,
+                                                                                        replay.game, replay.payouts))
+    print("Replayed {} games, {} did not match".format(games, failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,152 @@
+"""
+Project Name: blackjack-bot
+File Name: shoe.py
+
+Description: The shoe of a table: seeded shuffles of one or more decks that cards are drawn from in order.
+"""
+
+
+import random
+import threading
+import card
+
+class Shoe:
+    """
+    Represents the shoe of a table: one or more decks shuffled together that cards are drawn from in order.
+
+    The shoe is shuffled once with a Fisher-Yates shuffle, after which drawing a card only moves a pointer forward.
+    Once the pointer passes the cut card the shoe asks to be shuffled before the next game. If the shoe runs out of
+    cards in the middle of a game, it is shuffled right away.
+
+    Every shuffle is driven by a Random seeded with a 63 bit seed, which after shuffling also draws the seed of the
+    next shuffle. The order of the cards, and of every shoe after it, is therefore fixed by one seed, so a shoe can be
+    restored to any recorded seed and position to replay a game.
+
+    Parameters:
+        decks | int
+            The number of 52 card decks in the shoe
+        penetration | float
+            Fraction of the shoe dealt before the cut card is reached
+        preshuffle | bool
+            If True, the next shoe is shuffled ahead of time on a background thread
+        seed | int
+            Seed of the first shuffle, a random one is chosen if None
+
+    Attributes:
+        codes | bytearray
+            The codes (see :class: 'Card') of the cards of the shoe in shuffled order
+        position | int
+            Index of the next card to be drawn
+        cut | int
+            Index of the cut card
+        shuffles | int
+            Number of times the shoe has been shuffled
+        seed | int
+            Seed of the current order of the shoe
+        next_seed | int
+            Seed of the next shuffle
+        on_shuffle | callable
+            Called with the shoe after every shuffle, or None
+    """
+
+    def __init__(self, decks=1, penetration=0.75, preshuffle=False, seed=None):
+        self.decks = decks
+        self.penetration = penetration
+        self.preshuffle = preshuffle
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self._ordered = card.Card.encode(card.Card.create_deck()) * decks
+        self.codes, self.next_seed = self._shuffled(self.seed)
+        self.position = 0
+        self.cut = int(len(self.codes) * penetration)
+        self.shuffles = 1
+        self.on_shuffle = None
+        self._next = None
+        self._next_thread = None
+        if preshuffle:
+            self._shuffle_next()
+
+    def __len__(self):
+        return len(self.codes) - self.position
+
+    def _shuffled(self, seed):
+        """
+        :param seed: int seed of the shuffle
+        :return: tuple of a new bytearray of the codes of the cards of the shoe in the order given by the seed, and the
+                 seed of the next shuffle
+        """
+        rng = random.Random(seed)
+        codes = bytearray(self._ordered)
+        rand = rng.random
+        for i in range(len(codes) - 1, 0, -1): # Fisher-Yates
+            j = int(rand() * (i + 1))
+            codes[i], codes[j] = codes[j], codes[i]
+        return codes, rng.getrandbits(63)
+
+    def _shuffle_next(self):
+        """
+        Starts shuffling the next shoe on a background thread.
+        """
+        seed = self.next_seed
+        def run():
+            self._next = (seed,) + self._shuffled(seed)
+        self._next_thread = threading.Thread(target=run, daemon=True)
+        self._next_thread.start()
+
+    def shuffle(self):
+        """
+        Replaces the cards with the next shuffled shoe and moves the pointer back to the first card.
+        """
+        if self._next_thread is not None:
+            self._next_thread.join()
+            self.seed, self.codes, self.next_seed = self._next
+            self._shuffle_next()
+        else:
+            self.seed = self.next_seed
+            self.codes, self.next_seed = self._shuffled(self.seed)
+        self.position = 0
+        self.shuffles += 1
+        if self.on_shuffle is not None:
+            self.on_shuffle(self)
+
+    def restore(self, seed, position):
+        """
+        Puts the shoe back in the state it was in after drawing a number of cards from the shuffle of a seed.
+        :param seed: int seed of the shuffle
+        :param position: int number of cards drawn since that shuffle
+        """
+        if self._next_thread is not None:
+            self._next_thread.join()
+        self.seed = seed
+        self.codes, self.next_seed = self._shuffled(seed)
+        self.position = position
+        if self.preshuffle:
+            self._shuffle_next()
+
+    def needs_shuffle(self):
+        """
+        :return: True if the cut card has been reached and the shoe should be shuffled before the next game
+        """
+        return self.position >= self.cut
+
+    def draw(self):
+        """
+        Draws the next card of the shoe.
+        :return: Card object
+        """
+        if self.position == len(self.codes):
+            self.shuffle()
+        drawn = self.codes[self.position]
+        self.position += 1
+        return card.Card.DECK[drawn]
+
+
+def test():
+    shoe = Shoe(decks=6, preshuffle=True)
+    while not shoe.needs_shuffle():
+        print(shoe.draw())
+    shoe.shuffle()
+    print("\n{} cards left after shuffling".format(len(shoe)))
+
+
+if __name__ == "__main__":
+    test()
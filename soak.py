@@ -0,0 +1,138 @@
+"""
+Project Name: blackjack-bot
+File Name: soak.py
+
+Description: Soak tests the bot with a day of continuous play on a virtual clock, watching for memory growth and stalls.
+"""
+
+import asyncio
+import gc
+import loadtest
+import sys
+import tracemalloc
+
+# hours of virtual play after which memory is measured as the baseline, once every table has filled its caches
+WARM_UP = 1
+
+
+class SoakTest(loadtest.LoadTest):
+    """
+    A 'LoadTest' that runs for a long stretch of virtual time with the tables' real phase times, sampling the size of
+    the bot's state every virtual hour to find memory that grows with the number of games played.
+
+    A session ends once every player of a table has quit, so the soak test starts a new session in every channel
+    whose table has ended, like its members would, and the members of that channel join again.
+
+    Attributes:
+        RESTART_INTERVAL | float
+            Virtual seconds between looking for channels without a table
+    """
+
+    RESTART_INTERVAL = 60
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.samples = list()
+        self.restarts = 0
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        tasks = [loop.create_task(self.sample_periodically()), loop.create_task(self.restart_sessions())]
+        try:
+            await super().run()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def restart_sessions(self):
+        while True:
+            await asyncio.sleep(self.RESTART_INTERVAL)
+            if self.loop.time() >= self.started + self.options.duration:
+                return
+            for channel in self.channels:
+                if channel.id not in self.bot.tables:
+                    self.joined = {key for key in self.joined if key[0] != channel.id}
+                    self.restarts += 1
+                    await self.bot.on_message(loadtest.FakeMessage("command", "$blackjack",
+                                                                   loadtest.FakeMember("1", "starter"), channel))
+
+    async def sample_periodically(self):
+        while True:
+            await asyncio.sleep(self.options.interval)
+            self.sample()
+
+    def sample(self):
+        import table as _table
+        bot = self.bot
+        gc.collect()
+        memory = sum(stat.size for stat in tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, loadtest.__file__), tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__))).statistics("filename"))
+        row = {
+            "hour": (self.loop.time() - self.started) / 3600,
+            "memory": memory,
+            "objects": len(gc.get_objects()),
+            "tasks": len(asyncio.all_tasks()),
+            "tables": len(bot.tables),
+            "players": sum(len(table.players) for table in bot.tables.values()),
+            "games": _table.GAMES.value,
+            "restarts": self.restarts,
+            "buckets": len(bot.outbox.channel_buckets),
+            "db cache": len(bot.database.cache),
+            "db pending": len(bot.database.pending),
+            "history queue": bot.history.events.qsize(),
+        }
+        if not self.samples:
+            print("  ".join("{:>13}".format(name) for name in row))
+        print("  ".join("{:>13}".format(format(value, ".1f") if isinstance(value, float) else value)
+                        for value in row.values()))
+        self.samples.append(row)
+
+    def check(self):
+        """
+        Compares the last sample with the sample taken after the warm-up.
+        :return: list of str problems found
+        """
+        problems = list()
+        baseline = next((row for row in self.samples if row["hour"] >= WARM_UP), None)
+        if baseline is None or baseline is self.samples[-1]:
+            return ["the soak test was too short to compare samples"]
+        last = self.samples[-1]
+        growth = (last["memory"] - baseline["memory"]) / 2 ** 20
+        if growth > self.options.max_growth:
+            problems.append("memory grew by {:.1f} MiB from hour {:.0f} to hour {:.0f}".format(
+                growth, baseline["hour"], last["hour"]))
+        for name in ("tasks", "buckets"):
+            if last[name] > baseline[name] * 2 + 10:
+                problems.append("{} grew from {} to {}".format(name, baseline[name], last[name]))
+        for before, after in zip(self.samples, self.samples[1:]):
+            if after["games"] == before["games"]:
+                problems.append("no games were played between hour {:.0f} and hour {:.0f}".format(
+                    before["hour"], after["hour"]))
+        if self.task_errors:
+            problems.append("{} task errors".format(self.task_errors))
+        return problems
+
+
+def main(args):
+    parser = loadtest.parser()
+    parser.description = "Soak tests blackjack-bot: a day of play against a fake Discord on a virtual clock."
+    parser.add_argument("--interval", type=float, default=3600, help="virtual seconds between samples")
+    parser.add_argument("--max-growth", type=float, default=5,
+                        help="MiB of memory the bot may grow by after the warm-up hour")
+    parser.set_defaults(duration=24 * 3600, time_scale=1, virtual=True, channels=10, members=8, rate=0.02)
+    options = parser.parse_args(args)
+    options.rate_limit = (int(options.rate_limit[0]), options.rate_limit[1])
+    handler = loadtest.install(options.seed)
+    tracemalloc.start()
+    test = SoakTest(options)
+    elapsed = loadtest.execute(test, options.virtual)
+    test.report(handler, elapsed)
+    problems = test.check()
+    for problem in problems:
+        print("PROBLEM: " + problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,529 @@
+"""
+Project Name: blackjack-bot
+File Name: table.py
+Author: Connor York (cxy1054@rit.edu)
+Updated: 7/20/16
+
+Discord is a voice and chat app for gamers created by Hammer & Chisel, a startup based in Burlingame, CA.
+More information on Discord and Hammer & Chisel can be found through the following links:
+    https://discordapp.com/
+    https://discordapp.com/company
+
+blackjack-bot is developed using the unofficial API for Discord. It is made and run by developers not affiliated with
+the company. The library used in this project can be found in the link below:
+    https://github.com/Rapptz/discord.py
+
+Description: blackjack-bot is a Discord 'bot' for emulating the card game Blackjack in the chat channels of servers.
+    A 'bot' is essentially a user that is run by some sort of AI instead of a person. They perform actions based on
+    messages in chat that are interpreted as commands. blackjack-bot uses commands in chat to emulate Blackjack.
+
+(These are probably not the correct terms in Blackjack, but they are consistently used within their definition in this project)
+TERMS:
+    ROUND = A decision, where each player decides what to do with their hand ONCE.
+    GAME = All of the rounds, from the initial betting till each player cannot play anymore and either wins or loses.
+    SESSION = All of the games. 'in session' means that there are currently players playing.
+
+The MIT License (MIT)
+
+Copyright (c) 2016 Connor York
+"""
+
+
+import advisor
+import asyncio
+import dealer as _dealer
+import engine
+import history as _history
+import metrics
+import phase as _phase
+import registry as _registry
+import shoe as _shoe
+import tracing
+import user
+PHASE_SECONDS = metrics.registry.histogram("blackjack_phase_seconds", "Seconds spent in each phase of a game", ("phase",))
+GAMES = metrics.registry.counter("blackjack_games_total", "Games played to the end")
+GAME_METER = metrics.Meter(60)
+metrics.registry.gauge("blackjack_games_per_minute", "Games finished in the last minute", function=GAME_METER.count)
+
+def guild_id(channel):
+    """
+    :param channel: discord.py :class: 'Channel'
+    :return: str id of the server the channel belongs to, or of the channel itself if it is a private channel
+    """
+    server = getattr(channel, "server", None)
+    return server.id if server is not None else channel.id
+
+class Table:
+    """
+    Represents a blackjack table in a channel, with its own players, dealer and shoe. Every channel with a session in
+    progress has its own Table, and every Table runs its session as its own task.
+
+    Parameters:
+        client | :class: 'BlackJackBot'
+            The client used to send messages and store users
+        channel | :class: 'Channel'
+            The channel the table is in
+
+    Attributes:
+        INTERMISSION_TIME | int
+            The number of seconds that intermission lasts
+        BETTING_TIME | int
+            The number of seconds that players are allowed to bet
+        PLAYING_TIME | int
+            The number of seconds that players are allowed to player per
+        client | :class: 'BlackJackBot'
+            The client used to send messages and store users
+        channel | :class: 'Channel'
+            The channel which is used to input and output messages.
+        players | :class: 'PlayerRegistry' of :class: 'User' from blackjack-bot, not discord.py
+            Iterable of all players currently playing in the game, indexed by member id.
+        dealer | :class: 'Dealer'
+            The user that the client is connected to represented as a player in Blackjack
+        shoe | :class: 'Shoe'
+            The shoe that the cards of the table are drawn from, whose seed is recorded in the history so every game
+            can be replayed (see replay.py)
+        advisor | :class: 'Advisor'
+            Answers the '$hint' command of players
+        commands | :class: 'Queue' of :class: 'Command'
+            The commands sent in the table's channel, waiting to be handled by the current phase
+        history | :class: 'TableHistory'
+            Records every deal, decision and settlement of the table's games
+        guild_id | str
+            The id of the server the channel belongs to, or of the channel itself for private channels. Players are
+            ranked on the leaderboard of this id.
+    """
+
+    INTERMISSION_TIME = 20
+    BETTING_TIME = 50
+    PLAYING_TIME = 120
+    MESSAGE_GAP = 10
+
+    SHOE_DECKS = 6
+    SHOE_PENETRATION = 0.75
+
+    COMMAND_QUEUE_SIZE = 256
+
+    # the shoe changes every game, so only the compositions of the current game are ever asked for again
+    ADVISOR_CACHE_SIZE = 8
+
+    PREFIX = "$"
+
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self.players = _registry.PlayerRegistry()
+        self.dealer = _dealer.Dealer(client.user)
+        self.shoe = _shoe.Shoe(self.SHOE_DECKS, self.SHOE_PENETRATION, preshuffle=True)
+        self.advisor = advisor.Advisor(self.ADVISOR_CACHE_SIZE)
+        self.commands = asyncio.Queue(maxsize=self.COMMAND_QUEUE_SIZE)
+        self.guild_id = guild_id(channel)
+        GAME_METER.clock = client.loop.time # games per minute of the loop's clock, which may be virtual, like a 'Phase'
+        self.history = _history.TableHistory(client.history, channel.id)
+        self.shoe.on_shuffle = self.history.shuffled
+
+################################################################################################
+######################################### GAME METHODS #########################################
+################################################################################################
+
+    async def run_session(self):
+        await self.client.outbox.send(self.channel, "Blackjack game commencing. Creating table.")
+        await self.pause()
+        game_counter = 0
+        while self.still_playing_session() or game_counter == 0:
+            with PHASE_SECONDS.labels("intermission").time(), tracing.span("intermission"):
+                await self.run_intermission()
+            if self.still_playing_session():
+                await self.print_players_with_bank()
+                await self.pause()
+                self.history.start_game(self.shoe)
+                with self.client.profiler.profile("game", self.channel.id), tracing.span("game", game=self.history.game):
+                    await self.run_game()
+                GAMES.inc()
+                GAME_METER.mark()
+                self.client.database.write_users(self.players, self.guild_id) # updates database every game
+            game_counter += 1
+        await self.client.outbox.send(self.channel, "Session ending, destroying table. Thanks for playing!")
+        self.reset_table()
+
+    async def run_game(self):
+        """
+        Runs the game, which is the time from after the bets have been placed, and the last player has finished
+        playing.
+        """
+        with PHASE_SECONDS.labels("betting").time(), tracing.span("betting"):
+            await self.run_betting()
+        self.force_bet()
+        await self.print_players_with_bet()
+        await self.pause()
+        if self.shoe.needs_shuffle():
+            cards_msg = self.client.outbox.live(self.channel, "Reached the cut card. Shuffling the shoe and dealing cards! Please hold!")
+        else:
+            cards_msg = self.client.outbox.live(self.channel, "Dealing cards! Please hold!")
+        await cards_msg.flush()
+        self.deal_cards()
+        self.advisor.warm(self.dealer, self.shoe)
+        await self.pause()
+        cards_msg.append(self.str_players_with_hand())
+        await cards_msg.flush()
+        await self.pause()
+        while self.still_playing_game():
+            with PHASE_SECONDS.labels("round").time(), tracing.span("round"):
+                await self.run_round()
+            self.ready_new_round_players()
+        with PHASE_SECONDS.labels("evaluation").time(), tracing.span("evaluation"):
+            evaluation = self.evaluate_game()
+        await self.client.outbox.send(self.channel, "There are no more players eligible to play, so the game is over!"
+                                              " Here evaluation to see who won!\n" + evaluation)
+        await self.pause()
+        await self.client.outbox.send(self.channel, "Resetting players for next game...")
+        await self.pause()
+        self.reset_players()
+
+    async def run_betting(self):
+        """
+        Lets players bet until everyone has bet or the betting time is up.
+        """
+        phase = _phase.Phase(self.BETTING_TIME, self.client.loop)
+        await self.client.outbox.send(self.channel, "Betting commencing. Enter '{}bet #' with '#' replaced with your bet! All "
+                                              "bets must be between 100 and 500 memes.".format(self.PREFIX))
+        confirm_msg = self.client.outbox.live(self.channel)
+        while self.still_betting() and not phase.is_over():
+            bet_cmd = await self.next_command(phase, ("bet",))
+            if bet_cmd:
+                player = self.get_player(bet_cmd.author)
+                if player: # if message author not in game, do nothing
+                    if len(bet_cmd.args) != 1:
+                        pass
+                    else:
+                        bet_amount = bet_cmd.args[0]
+                        if bet_amount.isdigit():
+                            if self.players.update(player, player.bet, int(bet_amount)):
+                                self.history.bet(player)
+                                confirm_msg.append("{} bet {} memes!".format(player.mention_user(), player.current_bet))
+                            else:
+                                confirm_msg.append("Bet must be a positive integer between 100 and 500 memes that is less than the amount"
+                                                   " in your bank.\n You ({}) currently have {} memes.".format(
+                                                       player.mention_user(), player.bank))
+                        else:
+                            confirm_msg.append("Bet must be a positive integer between 100 and 500 memes that is less than the amount"
+                                               " in your bank.\n You ({}) currently have {} memes.".format(
+                                                   player.mention_user(), player.bank))
+        await confirm_msg.flush()
+
+
+    async def run_round(self):
+        """
+        Lets every player still in the game hit or hold once, ending early when everyone has decided.
+        """
+        phase = _phase.Phase(self.PLAYING_TIME, self.client.loop)
+        await self.client.outbox.send(self.channel, "The round in commencing. Enter '{}hit' or '{}hold' to play! Not sure? Enter "
+                                              "'{}hint' for advice.".format(self.PREFIX, self.PREFIX, self.PREFIX))
+        play_msg = self.client.outbox.live(self.channel)
+        while self.still_deciding() and not phase.is_over():
+            play_cmd = await self.next_command(phase, ("hit", "hold", "hint"))
+            if play_cmd:
+                player = self.get_player(play_cmd.author)
+                if player:
+                    if play_cmd.name == "hit":
+                        if self.players.update(player, player.hit): #success
+                            self.history.hit(player)
+                            play_msg.append("{} hit!".format(player.mention_user()))
+                        else:
+                            play_msg.append("{} can not hit!".format(player.mention_user()))
+                    elif play_cmd.name == "hold":
+                        if self.players.update(player, player.hold): #success
+                            self.history.hold(player)
+                            play_msg.append("{} held their hand!".format(player.mention_user()))
+                        else:
+                            play_msg.append("{} cannot hold! They may have already played or "
+                                            "are not playing this round. ".format(player.mention_user()))
+                    elif play_cmd.name == "hint":
+                        play_msg.append(self.str_hint(player))
+            else:
+                break
+        await play_msg.flush()
+        end_message = self.client.outbox.live(self.channel, "Either all players played or the time is up! The round is now over. Preparing everyone for post round evaluation.")
+        await end_message.flush()
+        await self.pause()
+        forced_players = self.force_hold()
+        if forced_players:
+            end_message.append(forced_players)
+            await end_message.flush()
+            await self.pause()
+        end_message.append("Here comes the new hands!")
+        await end_message.flush()
+        await self.pause()
+        end_message.append(self.str_players_with_hand())
+        await end_message.flush()
+        await self.pause()
+        eval_message = self.client.outbox.live(self.channel, "Running algorithms to evaluate players based on last round.")
+        await eval_message.flush()
+        await self.pause()
+        busted = self.evaluate_players()
+        if busted:
+            eval_message.append(busted)
+            await eval_message.flush()
+
+    async def run_intermission(self):
+        """
+        Lets people join or quit the table until the intermission time is up.
+        """
+        phase = _phase.Phase(self.INTERMISSION_TIME, self.client.loop)
+        await self.client.outbox.send(self.channel, "Intermission commencing. Type '{}join' to join the table or '{}quit' to leave!"
+                                              " All new players start with 5000 memes.".format(self.PREFIX, self.PREFIX))
+        confirm_msg = self.client.outbox.live(self.channel)
+        joined = list()
+        quitters = list()
+        while not phase.is_over():
+            join_cmd = await self.next_command(phase, ("join", "quit"))
+            if join_cmd:
+                if join_cmd.name == "join":
+                    seat = self.client.seats.get(join_cmd.author.id)
+                    if seat is not None and seat is not self: # every member has one bank, played at one table
+                        confirm_msg.append("<@{}> is already playing in <#{}>. Quit that table to join this one.".format(
+                            join_cmd.author.id, seat.channel.id))
+                    elif self.get_player(join_cmd.author) is None:
+                        self.players.add(user.User(join_cmd.author))
+                        self.client.seats[join_cmd.author.id] = self
+                        confirm_msg.append("{} joined!".format(self.get_player(join_cmd.author).mention_user()))
+                        joined.append(self.get_player(join_cmd.author))
+                elif join_cmd.name == "quit":
+                    player = self.get_player(join_cmd.author)
+                    if player:
+                        self.players.remove(player)
+                        self.client.seats.pop(player.id, None)
+                        confirm_msg.append("{} quit!".format(player.mention_user()))
+                        quitters.append(player)
+        await confirm_msg.flush()
+        if joined: # banks of everyone who joined are loaded together, before quitters are saved
+            await self.client.database.load_users(joined)
+        if quitters:
+            self.client.database.write_users(quitters, self.guild_id)
+
+################################################################################################
+######################################## HELPER METHODS ########################################
+################################################################################################
+
+    async def next_command(self, phase, names):
+        """
+        Takes commands off the table's queue until one of the passed names arrives or the phase is over. Commands
+        that do not belong to the current phase are dropped.
+        :param phase: 'Phase' that is currently running
+        :param names: tuple of the names of the commands the phase handles
+        :return: 'Command', or None if the phase ended first
+        """
+        while True:
+            try:
+                with tracing.span("wait_for_command"):
+                    cmd = await asyncio.wait_for(self.commands.get(), phase.remaining())
+            except asyncio.TimeoutError:
+                return None
+            if cmd.name in names:
+                cmd.handled()
+                return cmd
+            cmd.handled("ignored")
+
+    async def pause(self):
+        """
+        Waits MESSAGE_GAP seconds between messages without blocking the event loop, so other tables keep playing.
+        """
+        with tracing.span("pause"):
+            await asyncio.sleep(self.MESSAGE_GAP)
+
+    def deal_cards(self):
+        """
+        Deals 2 cards from the shoe to every player, including the dealer. The shoe is shuffled first if the cut card
+        was reached during the last game.
+        """
+        if self.shoe.needs_shuffle():
+            self.shoe.shuffle()
+        self.dealer.deal(self.shoe)
+        self.history.deal(self.dealer)
+        for player in self.players:
+            player.deal(self.shoe)
+            self.history.deal(player)
+        self.players.recount()
+
+    def evaluate_players(self):
+        #check each player to see if they have busted and update their variables
+        message = ""
+        for player in self.players:
+            if player.is_playing and player.is_bust():
+                message += "    " + player.mention_user()
+                player.bust()
+                self.history.bust(player)
+        self.players.recount()
+        if message:
+            return "Busted players:\n\n" + message
+
+    def evaluate_game(self):
+        """
+        Determines the winners and losers of the game. This method is called at the end of the game to create a str
+        representation of the end game statistics and to edit the banks of the players in the game.
+        :return: str representing the end game stats
+        """
+        self.dealer.hit_until_hold()
+        for c in self.dealer.hand[2:]:
+            self.history.dealer_draw(c)
+        message = self.bold_message(self.dealer.final_str_with_hand()+ "\n")
+        outcome, results = engine.settle_game(self.dealer, self.players)
+        if outcome == engine.DEALER_BLACKJACK:
+            message += "The Dealer has Blackjack. All players without blackjack will lose the round.\n\n"
+        elif outcome == engine.DEALER_BUST:
+            message += "The Dealer is busted. All players left in the game win.\n\n"
+        else:
+            message += "The Dealer has a hand value of {}. All non-busted players above this value win!\n\n".format(self.dealer.low_value)
+        for player, result, amount in results:
+            player.record_result(result, amount)
+            self.history.settle(player, result, amount)
+            if result == engine.WON:
+                message += "    " + player.mention_user() + " won " + self.bold_message(str(amount)) + " memes\n"
+            elif result == engine.LOST:
+                message += "    " + player.mention_user() + " lost " + self.bold_message(str(amount)) + " memes\n"
+            elif outcome == engine.DEALER_BLACKJACK:
+                message += "    " + player.mention_user() + " also had blackjack so they gained/lost no memes.\n"
+            else:
+                message += "    " + player.mention_user() + " tied and gained/lost no memes.\n"
+        return message
+
+    def reset_table(self):
+        """
+        Resets the table's state to initial values, preparing it for a new session.
+        """
+        self.free_seats()
+        self.players.clear()
+        self.dealer = _dealer.Dealer(self.client.user)
+
+    def free_seats(self):
+        """
+        Lets the players of the table join tables in other channels.
+        """
+        for player in self.players:
+            if self.client.seats.get(player.id) is self:
+                del self.client.seats[player.id]
+
+    def reset_players(self):
+        """
+        Resets the state of all players to initial values.
+        """
+        self.dealer.reset()
+        for player in self.players:
+            player.reset()
+            if player.bank <= 500:
+                player.set_bank(1000)
+        self.players.recount()
+
+    def force_hold(self):
+        """
+        Forces players who did not input a command for the round to hold.
+        :return: str stating the players that did not respond
+        """
+        names = ""
+        for player in self.players:
+            if not player.has_played:
+                player.hold()
+                self.history.force_hold(player)
+                names += player.mention_user() + ","
+        self.players.recount()
+        if names:
+            return "Forced {} to hold because they took too long to decide last round.".format(names)
+
+    def force_bet(self):
+        names = ""
+        for player in self.players:
+            if player.current_bet == 0:
+                player.bet(100)
+                self.history.force_bet(player)
+                names += player.mention_user() + ","
+        self.players.recount()
+        if names:
+            return "Forced {} to bet because they took too long to bet.".format(names)
+
+    def ready_new_round_players(self):
+        """
+        Resets valid player's 'has_played' variable so that they are allowed to play in the next round
+        """
+        for player in self.players:
+            if player.is_playing:
+                player.has_played = False
+        self.players.recount()
+
+    def still_playing_session(self):
+        """
+        Determines if there are still players playing blackjack
+        :return: True if there are still players playing, False otherwise
+        """
+        return len(self.players) != 0
+
+    def still_playing_game(self):
+        """
+        Determines if there are still players that are eligible to play in a round. This means that they are not
+        holding or busted.
+        :return: True if there are still eligible players, False if not
+        """
+        return self.players.playing != 0
+
+    def still_deciding(self):
+        """
+        Determines if the decision time is still in action, meaning that players still have not hit or held their hand.
+        :return: Whether or not there are players that have not decided what to do (hit or hold)
+        """
+        return self.players.not_played != 0
+
+    def still_betting(self):
+        """
+        Determines if there are still players in the game who have not bet.
+        :return: True if there are currently players with no bet, False otherwise
+        """
+        return self.players.not_bet != 0
+
+    def get_player(self, member):
+        return self.players.get(member.id)
+
+###############################################################################################
+######################################## PRINT METHODS ########################################
+###############################################################################################
+
+    def str_players_with_hand(self):
+        """
+        Creates a str of all the players in the session with their hands.
+        This does not send a message.
+        :return: str of players with their hands
+        """
+        message = "Players and their hands\n\n" + self.bold_message(self.dealer.str_with_hand()) + "\n"
+        for player in self.players:
+            message += player.str_with_hand() + "\n"
+        return message
+
+    def str_hint(self, player):
+        """
+        Creates a str advising the player to hit or hold, based on their hand, the dealer's visible card and the
+        cards left in the shoe.
+        :param player: 'User' that asked for a hint
+        :return: str of the advice
+        """
+        if not player.is_playing or player.has_played:
+            return "{} has no decision to make this round.".format(player.mention_user())
+        hold_ev, hit_ev = self.advisor.advise(player, self.dealer, self.shoe)
+        return "{} you can expect to win {:+.2f} of your bet by hitting and {:+.2f} by holding. {}!".format(
+            player.mention_user(), hit_ev, hold_ev, self.bold_message("Hit" if hit_ev > hold_ev else "Hold"))
+
+    async def print_players_with_bet(self):
+        bet_msg = self.client.outbox.live(self.channel, "Here comes everyone's bets for the round!")
+        await bet_msg.flush()
+        await self.pause()
+        message = "Players and their bets\n\n"
+        for player in self.players:
+            message += player.str_with_bet() + "\n"
+        bet_msg.append(message)
+        await bet_msg.flush()
+
+    async def print_players_with_bank(self):
+        message = "Players and their banks\n\n"
+        for player in self.players:
+            message += player.str_with_bank() + "\n"
+        await self.client.outbox.send(self.channel, message)
+
+    @staticmethod
+    def bold_message(message):
+        return "**{}**".format(message)
@@ -0,0 +1,245 @@
+"""
+Project Name: blackjack-bot
+File Name: tracing.py
+
+Description: Records nested spans of the bot's work and writes them as Chrome trace events from a background thread.
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+# the innermost span of the running task, which new spans are nested in and take their table and game from
+_current = contextvars.ContextVar("span", default=None)
+
+# ids of the tasks started with 'detach', whose spans are recorded as async events
+_task_ids = itertools.count(1)
+
+
+class Span:
+    """
+    A named stretch of time, recorded when it is exited. A span entered inside another one inherits its arguments,
+    such as the table and game number, and tasks created inside a span see it as their parent, unless they are
+    created with 'detach'.
+
+    Parameters:
+        tracer | :class: 'Tracer'
+            The tracer the span is recorded to
+        name | str
+            The name of the span
+        args | dict
+            Arguments shown with the span in the trace viewer
+        task | int
+            The id of the detached task the span is in, or None if it is not in one
+    """
+
+    __slots__ = ("tracer", "name", "args", "start", "token", "task")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.task = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            self.args = dict(parent.args, **self.args)
+            self.task = parent.task
+        self.token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _current.reset(self.token)
+        self.tracer.record(self.name, self.start, end, self.args, self.task)
+
+
+class _Detached:
+    """
+    The parent of the outermost spans of a task started with 'detach'.
+    """
+
+    __slots__ = ("args", "task")
+
+    def __init__(self, args, task):
+        self.args = args
+        self.task = task
+
+
+class _NoSpan:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Writes spans as Chrome trace events (the JSON format read by chrome://tracing and Perfetto) from a background
+    thread, so recording a span never waits on the disk. While the tracer is stopped, spans cost one attribute check.
+
+    Every table gets its own track in the viewer, named after its channel, and spans outside of a table go to the
+    'bot' track. Once a file holds EVENTS_PER_FILE events a new one is started, and only the newest FILES files are
+    kept, so a tracer can be left on for hours.
+
+    Attributes:
+        directory | str
+            The directory the trace files are written to, or None while the tracer is stopped
+        enabled | bool
+            True while spans are recorded
+    """
+
+    EVENTS_PER_FILE = 200000
+    FILES = 10
+    FLUSH_INTERVAL = 1.0
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self):
+        self.directory = None
+        self.enabled = False
+        self.events = None
+        self._thread = None
+        self._origin = time.perf_counter()
+        self._tracks = {None: 0}
+
+    def start(self, directory):
+        """
+        Starts recording spans to new files in a directory.
+        :param directory: str directory of the trace files, created if it does not exist
+        """
+        if self.enabled:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.events = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_events, name="tracer", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def stop(self):
+        """
+        Stops recording and finishes the current file. Blocks until every recorded span is written.
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.events.put(None)
+        self._thread.join()
+        self.directory = None
+
+    def span(self, name, **args):
+        """
+        :param name: str name of the span
+        :param args: arguments of the span, e.g. table and game
+        :return: context manager that records the time spent inside it, which may span awaits
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return Span(self, name, args)
+
+    def record(self, name, start, end, args, task=None):
+        if self.enabled:
+            self.events.put((name, start, end, args, task))
+
+    def _write_events(self):
+        file = None
+        written = 0
+        files = 0
+        named = set() # tracks whose names were written to the current file
+        paths = list()
+        while True:
+            try:
+                event = self.events.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                if file is not None:
+                    file.flush()
+                continue
+            if event is None:
+                break
+            if file is None or written >= self.EVENTS_PER_FILE:
+                if file is not None:
+                    self._close(file)
+                path = os.path.join(self.directory, "trace-{}-{:04d}.json".format(time.strftime("%Y%m%d-%H%M%S"),
+                                                                               files))
+                file = open(path, "w", buffering=self.BUFFER_SIZE)
+                file.write("[")
+                paths.append(path)
+                files += 1
+                if len(paths) > self.FILES:
+                    os.remove(paths.pop(0))
+                written = 0
+                named.clear()
+            for trace_event in self._trace_events(event, named):
+                file.write(",\n" if written else "\n")
+                file.write(json.dumps(trace_event, default=str))
+                written += 1
+        if file is not None:
+            self._close(file)
+
+    @staticmethod
+    def _close(file):
+        file.write("\n]\n") # a file cut off before this still loads
+        file.close()
+
+    def _trace_events(self, event, named):
+        """
+        :return: list of the Chrome trace events of a span, preceded by the name of its track if it is new to the file
+        """
+        name, start, end, args, task = event
+        table = args.get("table")
+        track = self._tracks.get(table)
+        if track is None:
+            track = self._tracks[table] = len(self._tracks)
+        trace_events = list()
+        if track not in named:
+            named.add(track)
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": track,
+                                 "args": {"name": "table " + str(table) if table is not None else "bot"}})
+        ts = round((start - self._origin) * 1e6, 1)
+        if task is None:
+            trace_events.append({"name": name, "cat": "blackjack", "ph": "X", "pid": 1, "tid": track, "ts": ts,
+                                 "dur": round((end - start) * 1e6, 1), "args": args})
+        else: # spans of detached tasks overlap those of the track without nesting in them, so they get their own row
+            trace_events.append({"name": name, "cat": "blackjack", "ph": "b", "id": task, "pid": 1, "tid": track,
+                                 "ts": ts, "args": args})
+            trace_events.append({"name": name, "cat": "blackjack", "ph": "e", "id": task, "pid": 1, "tid": track,
+                                 "ts": round((end - self._origin) * 1e6, 1)})
+        return trace_events
+
+
+# the tracer every module of the bot records spans to
+tracer = Tracer()
+
+def span(name, **args):
+    """
+    :return: context manager recording a span to the bot's tracer, see :meth: 'Tracer.span'
+    """
+    return tracer.span(name, **args)
+
+
+def detach(loop, coroutine, **args):
+    """
+    Creates a task outside of the current span, for work that outlives the code that starts it, such as a message
+    flushed after a delay. The spans of the task are recorded as async events of their own, which the trace viewer
+    draws beside the spans of the track instead of across them.
+    :param loop: event loop of the task
+    :param coroutine: coroutine the task runs
+    :param args: arguments of every span of the task, e.g. table
+    :return: :class: 'Task'
+    """
+    context = contextvars.Context()
+    context.run(_current.set, _Detached(args, next(_task_ids)))
+    return context.run(loop.create_task, coroutine)
@@ -43,8 +43,10 @@ class User(player.Player):
             Unique id for a specific user
         bank | int
             Amount of money the player currently possesses
-        bet | int
+        current_bet | int
             Bet for the current game
+        hands, wins, losses, pushes, blackjacks, net | int
+            Results of the games played since the user was last saved
     """
 
     def __init__(self, member):
@@ -53,6 +55,12 @@ class User(player.Player):
         self.id = member.id
         self.bank = 5000
         self.current_bet = 0 # zero means that there is no current bet
+        self.hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.pushes = 0
+        self.blackjacks = 0
+        self.net = 0
 
     def str_with_hand(self):
         return self.mention_user() + ":\n" + self.hand_str()
@@ -107,3 +115,30 @@ class User(player.Player):
         :param new: int value of new bank
         """
         self.bank = new
+
+    def record_result(self, result, amount):
+        """
+        Counts the result of a game towards the user's stats.
+        :param result: 'won', 'lost' or 'push', as settled by engine.settle_game
+        :param amount: int memes won or lost
+        """
+        self.hands += 1
+        if result == "won":
+            self.wins += 1
+            self.net += amount
+            if self.has_blackjack():
+                self.blackjacks += 1
+        elif result == "lost":
+            self.losses += 1
+            self.net -= amount
+        else:
+            self.pushes += 1
+
+    def take_stats(self):
+        """
+        Hands over the results recorded since the last save and starts counting from zero.
+        :return: tuple of hands, wins, losses, pushes, blackjacks and net
+        """
+        stats = (self.hands, self.wins, self.losses, self.pushes, self.blackjacks, self.net)
+        self.hands = self.wins = self.losses = self.pushes = self.blackjacks = self.net = 0
+        return stats